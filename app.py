@@ -5,6 +5,7 @@ from src.visualization.layout.layout_reconciliation import reconciliation_layout
 from src.visualization.layout.visuals import trends_layout
 from src.visualization.layout.components.footer import app_footer
 from src.visualization import backend
+from src.visualization.export import register_export_route
 from src.visualization.layout.user_anomalies import anomalies_layout
 from src.visualization.layout.readme import readme_layout
 
@@ -47,6 +48,7 @@ def render_tab_content(tab):
 backend.register_callbacks(app)
 
 server = app.server
+register_export_route(server)
 
 if __name__ == "__main__":
     app.run(debug=True)
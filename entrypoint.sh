@@ -1,14 +1,11 @@
 #!/bin/bash
 set -e  # Exit on error
 
-echo "Running database initialization scripts..."
+echo "Loading, parsing and reconciling log files..."
+python src/pipeline/run_pipeline.py  # load raw logs, parse and reconcile in one process
 
-echo "initialization of Database..."
-python src/storage/init_db.py #initialize db
-echo "Loading log files to Database..."
-python src/ingestion/load_raw_logs.py #load raw logs to sqlite3 db
-python src/ingestion/parse_raw_to_parsed.py  # clean and transformation
-python src/transformation/reconcile_events.py  # transformed table for dashboard
+echo "Generating overdraft and reconciliation reports..."
+python src/reporting/generate_reports.py  # only periods not generated yet or changed since
 
 echo "Starting Dash app..."
 exec gunicorn -b 0.0.0.0:8050 app:server
@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.ingestion.load_raw_logs import LOGS_DIR, read_gz_file
+from src.ingestion.parse_raw_to_parsed import (
+    parse_log_string,
+    filter_logs_by_keywords,
+    extract_info,
+    manual_parse,
+    scan_record,
+)
+from src.ingestion.payload_decoder import new_stats
+
+
+def find_metadata_bounds(raw_str: str):
+    """
+    Returns (start_index, end_index) of metadata JSON inside raw_str.
+    If not found, returns (None, None).
+    """
+    # Clean string similar to manual_parse
+    s = (raw_str.strip()
+        .replace("None", "null")
+        .replace("True", "true")
+        .replace("False", "false")
+        .replace("\\'", "'")
+        .replace("'", '"')
+        .replace("\\\\", "")
+    )
+
+    # Locate 'metadata'
+    meta_pos = s.find('metadata')
+    if meta_pos == -1:
+        return None, None
+
+    # Find first '{' after 'metadata'
+    start = s.find("{", meta_pos)
+    if start == -1:
+        return None, None
+
+    # Match braces to find end
+    brace_count = 0
+    for i in range(start, len(s)):
+        if s[i] == '{':
+            brace_count += 1
+        elif s[i] == '}':
+            brace_count -= 1
+            if brace_count == 0:
+                return start, i+1  # return start and end index
+
+    return None, None
+
+
+def manual_parse_dep(raw_str):
+    """
+    The original character-by-character scanner that scan_record replaced,
+    kept as the baseline (and reference output) of this benchmark.
+    """
+    resultList = []
+    for r in raw_str:
+        # Remove outer braces if present
+        s = str(r).strip()
+        s = (s.replace("None", "null")
+            .replace("True", "true")
+            .replace("False", "false")
+            .replace("[", "")
+            .replace("\\'", "'")        # remove escaped single quotes
+            .replace("'", '"')          # use double quotes for JSON
+            .replace("\\\\", "")        # remove stray backslashes
+        )
+
+        start_meta, end_meta = find_metadata_bounds(s)
+
+        is_meta = True
+        if start_meta is None or end_meta is None:
+            is_meta = False
+
+        colon_positions = [i for i, ch in enumerate(s) if ch == ':']
+        result = {}
+
+        for idx in colon_positions:
+            if is_meta:
+                if idx > start_meta and idx < end_meta:
+                    continue
+
+            # ---- Get key (scan left) ----
+            j = idx - 1
+            while j >= 0 and s[j] not in "{,":
+                j -= 1
+            key = s[j+1:idx].strip().strip("'\" ")
+        
+            # ---- Get value (scan right) ----
+            k = idx + 1
+            while k < len(s) and s[k] in " '\"":
+                k += 1
+            # Skip if nested dict starts here
+            if k < len(s) and s[k] == '{':
+                continue
+            # Otherwise, capture till comma or end
+            m = k
+            while m < len(s) and s[m] not in ",}":
+                m += 1
+            value = s[k:m].strip().strip("'\" ")
+        
+            if key and value:
+                result[key] = value
+
+        resultList.append(result)
+    return resultList
+
+
+def load_logs(logs_dir=LOGS_DIR):
+    """Filtered log lines of every balance-sync file in the Logs/ corpus."""
+    corpus = []
+    for root, dirs, files in os.walk(logs_dir):
+        for file in files:
+            if not file.endswith(".gz"):
+                continue
+            raw_text = read_gz_file(os.path.join(root, file))
+            if "Start syncing the balance" not in raw_text:
+                continue
+            corpus.append(filter_logs_by_keywords(parse_log_string(raw_text)))
+    return corpus
+
+
+def load_records(logs_dir=LOGS_DIR):
+    """
+    Run the bundled Logs/ corpus up to extract_info with raw (undecoded)
+    payloads, returning one list of records per file: the input of the
+    tolerant scanners.
+    """
+    return [extract_info(logs, decode=False) for logs in load_logs(logs_dir)]
+
+
+def time_parser(parse_fn, corpus, repeat):
+    """Best-of-repeat wall time for parsing the whole corpus once."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for records in corpus:
+            parse_fn(records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def long_payload(n_colons):
+    """
+    One record whose 'data' holds a single comma-free value with many
+    colons (think concatenated ISO timestamps). Every colon yields a key
+    spanning the run so far; the old scanner also walks back over it char
+    by char.
+    """
+    stamps = " ".join(f"2024-04-27T09:{i % 60:02d}:00" for i in range(n_colons // 2))
+    return [{"RequestId": "bench", "StartSyncBalance": [{"time": "2024-04-27", "data": f"{{ note: '{stamps}' }}"}]}]
+
+
+def scan_records(records):
+    return [scan_record(record) for record in records]
+
+
+def run_benchmark(logs_dir=LOGS_DIR, repeat=3):
+    logs_corpus = load_logs(logs_dir)
+    corpus = [extract_info(logs, decode=False) for logs in logs_corpus]
+    n_records = sum(len(records) for records in corpus)
+
+    # Both scanners must agree before their timings mean anything
+    for records in corpus:
+        if scan_records(records) != manual_parse_dep(records):
+            raise AssertionError("scan_record output differs from manual_parse_dep")
+
+    old = time_parser(manual_parse_dep, corpus, repeat)
+    new = time_parser(scan_records, corpus, repeat)
+
+    print(f"Corpus: {len(corpus)} files, {n_records} records ({logs_dir})")
+    print(f"manual_parse_dep: {old:.3f}s ({n_records / old:,.0f} records/s)")
+    print(f"scan_record:      {new:.3f}s ({n_records / new:,.0f} records/s)")
+    print(f"Speedup: {old / new:.1f}x")
+
+    # Full extract + flatten: raw payloads through the scanner vs decoded
+    # payloads through manual_parse
+    stats = new_stats()
+    for logs in logs_corpus:
+        manual_parse(extract_info(logs, stats), stats)
+    scanned = time_parser(lambda logs: scan_records(extract_info(logs, decode=False)), logs_corpus, repeat)
+    decoded = time_parser(lambda logs: manual_parse(extract_info(logs)), logs_corpus, repeat)
+    print(f"extract_info + scan_record:  {scanned:.3f}s")
+    print(f"extract_info + manual_parse: {decoded:.3f}s ({scanned / decoded:.1f}x)")
+    print(f"Payload decoder: {stats['decoded']} decoded, {stats['malformed']} malformed, "
+          f"{stats['fallback_records']} records parsed by the fallback scanner")
+
+    print("Single long payload (colons: old / new):")
+    for n_colons in (250, 500, 1000):
+        records = long_payload(n_colons)
+        old = time_parser(manual_parse_dep, [records], 1)
+        new = time_parser(scan_records, [records], 1)
+        print(f"  {n_colons:>6}: {old:.3f}s / {new:.4f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the payload decoder and scanner against manual_parse_dep.")
+    parser.add_argument("--logs-dir", default=LOGS_DIR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.logs_dir, args.repeat)
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import argparse
+import threading
+from contextlib import redirect_stdout
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.db_manager import Database
+from src.ingestion.load_raw_logs import read_gz_file, ensure_raw_data, load_files
+from src.ingestion.parse_raw_to_parsed import (
+    PARSE_WORKERS,
+    parse_raw_table_to_parsed_logs,
+    parse_log_string,
+    filter_logs_by_keywords,
+    extract_info,
+    manual_parse,
+    should_parse,
+    to_parsed_rows,
+    ensure_parse_status,
+    ensure_parsed_logs_schema,
+)
+from src.ingestion.payload_decoder import new_stats
+from src.transformation.reconcile_events import populate_reconcile_events
+from src.pipeline.run_pipeline import run_pipeline
+from src.benchmark.generate_logs import generate_scaled_corpus
+
+# Stages in pipeline order, with what their `rows` count
+STAGES = (
+    ("read_gz_file", "files"),
+    ("parse_log_string", "log entries"),
+    ("extract_info", "records"),
+    ("manual_parse", "transactions"),
+    ("insert_rows_dynamic", "rows"),
+    ("populate_reconcile_events", "rows"),
+)
+
+# Ingestion paths compared by compare_direct, from .gz files to parsed_logs
+PATHS = (
+    ("two-step", "rows"),   # load_raw_logs.py, then parse_raw_to_parsed.py
+    ("direct", "rows"),     # run_pipeline.py --direct --no-reconcile
+)
+
+# Seconds between RSS samples
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak so far where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in KiB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class StageMeter:
+    """
+    Per-stage wall time, row and byte counts, and peak RSS.
+
+    Files stream through every stage one at a time, so the corpus is never
+    held in memory. A sampler thread charges the RSS it reads to whichever
+    stage is running at that moment.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.results = {name: {"seconds": 0.0, "rows": 0, "bytes": 0, "peak_rss": 0} for name, _ in stages}
+        self.current = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self._charge(self.current)
+
+    def _charge(self, stage):
+        if stage is not None:
+            entry = self.results[stage]
+            entry["peak_rss"] = max(entry["peak_rss"], current_rss())
+
+    def __enter__(self):
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._sampler.join()
+
+    def run(self, stage, fn, *args, nbytes=0, count=len):
+        """Call fn(*args) as part of `stage`; count(result) is added to its rows."""
+        self.current = stage
+        started = time.perf_counter()
+        result = fn(*args)
+        entry = self.results[stage]
+        entry["seconds"] += time.perf_counter() - started
+        entry["rows"] += count(result)
+        entry["bytes"] += nbytes
+        self._charge(stage)
+        self.current = None
+        return result
+
+
+def run_stages(logs_dir, meter):
+    """
+    Push every .gz under logs_dir through the parse steps and into
+    parsed_logs of the database at DB_PATH, then reconcile it.
+    """
+    stats = new_stats()
+    with Database() as db:
+        ensure_raw_data(db)
+        ensure_parse_status(db)
+        ensure_parsed_logs_schema(db)
+        for root, dirs, files in os.walk(logs_dir):
+            for file in files:
+                if not file.endswith(".gz"):
+                    continue
+                filename = os.path.basename(root)
+                raw_text = meter.run("read_gz_file", read_gz_file, os.path.join(root, file), count=lambda _: 1)
+                nbytes = len(raw_text)
+                meter.results["read_gz_file"]["bytes"] += nbytes
+                if not should_parse(filename, raw_text):
+                    continue
+
+                logs = meter.run("parse_log_string", parse_log_string, raw_text, nbytes=nbytes)
+                records = meter.run("extract_info", lambda: extract_info(filter_logs_by_keywords(logs), stats),
+                                    nbytes=nbytes)
+                transactions = meter.run("manual_parse", manual_parse, records, stats, nbytes=nbytes)
+                rows = to_parsed_rows(filename, transactions)
+                if rows:
+                    meter.run("insert_rows_dynamic", db.insert_rows_dynamic, "parsed_logs", rows,
+                              nbytes=nbytes, count=lambda _: len(rows))
+
+        corpus_bytes = meter.results["read_gz_file"]["bytes"]
+        meter.run("populate_reconcile_events", populate_reconcile_events, True, nbytes=corpus_bytes,
+                  count=lambda _: int(db.execute_query("SELECT COUNT(*) AS n FROM reconcile_events")["n"].iloc[0]))
+    return stats
+
+
+def format_results(scale, results, stages=STAGES):
+    lines = []
+    for name, unit in stages:
+        entry = results[name]
+        seconds = max(entry["seconds"], 1e-9)
+        lines.append(
+            f"{scale:>5}x  {name:<26} {entry['seconds']:>8.2f}s {entry['rows']:>10,} {unit:<12} "
+            f"{entry['rows'] / seconds:>12,.0f}/s {entry['bytes'] / 1e6 / seconds:>9.1f} MB/s "
+            f"{entry['peak_rss'] / 1e6:>8.0f} MB"
+        )
+    return lines
+
+
+def corpus_bytes(logs_dir):
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, dirs, files in os.walk(logs_dir) for file in files if file.endswith(".gz"))
+
+
+def fresh_database(db_path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.environ["DB_PATH"] = db_path
+
+
+def parsed_row_count():
+    with Database() as db:
+        return int(db.execute_query("SELECT COUNT(*) AS n FROM parsed_logs")["n"].iloc[0])
+
+
+def two_step(logs_dir, workers):
+    load_files(logs_dir=logs_dir)
+    parse_raw_table_to_parsed_logs(workers=workers)
+
+
+def direct(logs_dir, workers):
+    run_pipeline(workers=workers, reconcile=False, direct=True, logs_dir=logs_dir)
+
+
+def compare_direct(scales=(1, 10), work_dir=None, keep=False, workers=PARSE_WORKERS, **generator_options):
+    """
+    For each scale, ingest the same synthetic corpus into a fresh database
+    through the two-step path (raw_data, then parsed_logs) and through the
+    direct mode, and print wall time, throughput over the .gz bytes, peak
+    RSS and database size of each, plus the direct mode's speedup.
+    """
+    base_dir = work_dir or tempfile.mkdtemp(prefix="calo-bench-")
+    previous_db_path = os.environ.get("DB_PATH")
+    print(f"{'scale':>6}  {'path':<26} {'time':>9} {'rows':>10} {'':<12} {'rows/s':>14} {'MB/s':>14} "
+          f"{'peak RSS':>11} {'db size':>10}")
+    try:
+        for scale in scales:
+            scale_dir = os.path.join(base_dir, f"scale_{scale}")
+            logs_dir = os.path.join(scale_dir, "logs")
+            if not os.path.isdir(logs_dir):
+                generate_scaled_corpus(logs_dir, scale=scale, **generator_options)
+            nbytes = corpus_bytes(logs_dir)
+
+            meter = StageMeter(PATHS)
+            db_sizes = {}
+            with meter, open(os.devnull, "w") as quiet:
+                for name, fn in (("two-step", two_step), ("direct", direct)):
+                    db_path = os.path.join(scale_dir, f"{name}.db")
+                    fresh_database(db_path)
+                    # Per-file progress lines would dominate the output
+                    with redirect_stdout(quiet):
+                        meter.run(name, fn, logs_dir, workers, nbytes=nbytes, count=lambda _: parsed_row_count())
+                    db_sizes[name] = os.path.getsize(db_path)
+
+            for line, (name, _) in zip(format_results(scale, meter.results, PATHS), PATHS):
+                print(f"{line} {db_sizes[name] / 1e6:>7.1f} MB")
+            speedup = meter.results["two-step"]["seconds"] / max(meter.results["direct"]["seconds"], 1e-9)
+            print(f"{scale:>5}x  direct is {speedup:.2f}x the two-step throughput")
+    finally:
+        if previous_db_path is None:
+            os.environ.pop("DB_PATH", None)
+        else:
+            os.environ["DB_PATH"] = previous_db_path
+        if not keep and work_dir is None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def run_benchmark(scales=(1, 10, 100), work_dir=None, keep=False, **generator_options):
+    """
+    For each scale, generate a synthetic corpus that many times the size of
+    the bundled one (see generate_logs.py), run it through the pipeline
+    stages into a fresh database and print per-stage throughput and peak
+    RSS. MB/s is raw log text covered per second of the stage.
+    """
+    base_dir = work_dir or tempfile.mkdtemp(prefix="calo-bench-")
+    previous_db_path = os.environ.get("DB_PATH")
+    print(f"{'scale':>6}  {'stage':<26} {'time':>9} {'rows':>10} {'':<12} {'rows/s':>14} {'MB/s':>14} {'peak RSS':>11}")
+    try:
+        for scale in scales:
+            scale_dir = os.path.join(base_dir, f"scale_{scale}")
+            logs_dir = os.path.join(scale_dir, "logs")
+            if not os.path.isdir(logs_dir):
+                summary = generate_scaled_corpus(logs_dir, scale=scale, **generator_options)
+                print(f"Generated {summary['files']} streams, {summary['transactions']} transactions, "
+                      f"{summary['bytes'] / 1e6:.1f} MB in {logs_dir}")
+
+            fresh_database(os.path.join(scale_dir, "bench.db"))
+
+            with StageMeter() as meter:
+                stats = run_stages(logs_dir, meter)
+            print(f"Payload decoder: {stats['decoded']} decoded, {stats['malformed']} malformed, "
+                  f"{stats['fallback_records']} records parsed by the fallback scanner.")
+            for line in format_results(scale, meter.results):
+                print(line)
+    finally:
+        if previous_db_path is None:
+            os.environ.pop("DB_PATH", None)
+        else:
+            os.environ["DB_PATH"] = previous_db_path
+        if not keep and work_dir is None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline on synthetic corpora.")
+    parser.add_argument("--scales", default="1,10,100",
+                        help="comma-separated corpus sizes relative to the bundled corpus (default 1,10,100)")
+    parser.add_argument("--work-dir", default=None,
+                        help="where corpora and databases go; existing corpora are reused (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the temp dir")
+    parser.add_argument("--mismatch-rate", type=float, default=0.05)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare-direct", action="store_true",
+                        help="compare the two-step load+parse path with run_pipeline.py --direct instead")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="parser processes for --compare-direct (default: PARSE_WORKERS env or 1)")
+    args = parser.parse_args()
+    options = dict(
+        scales=[float(scale) if "." in scale else int(scale) for scale in args.scales.split(",")],
+        work_dir=args.work_dir,
+        keep=args.keep,
+        mismatch_rate=args.mismatch_rate,
+        noise=args.noise,
+        seed=args.seed,
+    )
+    if args.compare_direct:
+        compare_direct(workers=args.workers, **options)
+    else:
+        run_benchmark(**options)
@@ -0,0 +1,271 @@
+import os
+import gzip
+import json
+import uuid
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+# Size of the bundled Logs/ corpus: log stream folders, synced transactions
+# (reconcile_events rows), distinct users and the share of invocations that
+# sync nothing. scale=1 generates a corpus of the same size.
+BUNDLED_STREAMS = 1672
+BUNDLED_TRANSACTIONS = 7154
+BUNDLED_USERS = 786
+BUNDLED_SKIP_RATE = 0.04
+BUNDLED_START = date(2023, 12, 12)
+BUNDLED_DAYS = 140
+
+# currency -> decimals used for amounts
+CURRENCIES = {"SAR": 2, "AED": 2, "BHD": 3, "KWD": 3, "OMR": 3}
+# (type, source, action) of a transaction
+TRANSACTION_KINDS = (
+    ("DEBIT", "MANUAL_DEDUCTION", "DELIVERY_DEDUCTION"),
+    ("CREDIT", "PAYMENT", "PAY_PENDING_AMOUNT"),
+    ("CREDIT", "PAYMENT", "REPLACE_FOOD"),
+    ("CREDIT", "PAYMENT", "CX_GIFT"),
+    ("DEBIT", "MANUAL_DEDUCTION", "ADDON_DEDUCTION"),
+)
+# Share of transactions logged in the older format without type/source/action
+UNTYPED_SHARE = 0.1
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+RUNTIME_ARN = "arn:aws:lambda:us-east-1::runtime:4cb686be08f980f530c1cbdeae970951c08b712057b80e8698cf4641214607d6"
+NOISE_MESSAGES = (
+    "Skipping the process, balance is already synced from other listeners",
+    "Balance is already synced from other listeners",
+    "SubscriptionBalanceUpdated event published",
+)
+SKIP_MESSAGE = ("Skipping the balance sync for create subscription, "
+                "it will be synced from create subscription payment listener")
+
+
+def js_number(value):
+    """A number as Node's console.log prints it (90, not 90.0)."""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def js_object(fields, indent=2):
+    """
+    Render a dict the way Node's util.inspect logs objects: unquoted keys,
+    single-quoted strings, one key per line.
+    """
+    pad = " " * indent
+    lines = []
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            rendered = js_object(value, indent + 2)
+        elif isinstance(value, bool):
+            rendered = "true" if value else "false"
+        elif isinstance(value, (int, float)):
+            rendered = js_number(value)
+        else:
+            rendered = "'" + str(value).replace("'", "\\'") + "'"
+        lines.append(f"{pad}{key}: {rendered}")
+    return "{\n" + ",\n".join(lines) + "\n" + " " * (indent - 2) + "}"
+
+
+def iso(ts):
+    return ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+
+
+class LogGenerator:
+    """
+    Synthetic balance-sync Lambda logs in the CloudWatch export format of
+    Logs/balance-sync-logs: one folder per log stream, named
+    `<day>-[$LATEST]<hex>`, holding a 000000.gz of blank-line separated
+    entries.
+
+    Each user's transactions form a balance chain (every oldBalance is the
+    previous newBalance). mismatch_rate plants issues in that share of
+    transactions, half as wrong newBalance values (CALCULATION ISSUE) and
+    half as 'not in sync' errors (BALANCE SYNC ISSUE). noise is the
+    probability of each kind of unrelated log line per invocation, and
+    skip_rate the share of extra invocations that sync nothing.
+    """
+
+    def __init__(self, users=BUNDLED_USERS, mismatch_rate=0.05, noise=0.5,
+                 skip_rate=BUNDLED_SKIP_RATE, seed=0):
+        self.rng = random.Random(seed)
+        self.mismatch_rate = mismatch_rate
+        self.noise = noise
+        self.skip_rate = skip_rate
+        self.users = [self._uuid() for _ in range(max(users, 1))]
+        self.currency = {user: self.rng.choice(list(CURRENCIES)) for user in self.users}
+        self.balance = {user: round(self.rng.uniform(0, 1000), 2) for user in self.users}
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _ulid(self):
+        return "01H" + "".join(self.rng.choices(ULID_ALPHABET, k=23))
+
+    def _entry(self, ts, request_id, level, message):
+        return f"{iso(ts)} {iso(ts)}\t{request_id}\t{level}\t{message}"
+
+    def transaction(self):
+        """Next transaction of a random user, continuing that user's balance chain."""
+        user = self.rng.choice(self.users)
+        decimals = CURRENCIES[self.currency[user]]
+        kind = self.rng.choice(TRANSACTION_KINDS)
+        amount = round(self.rng.choice((8, 55, 90, 270, 546)) * self.rng.uniform(0.5, 1.5), decimals)
+        vat = round(amount * self.rng.choice((0, 0, 0.05, 0.1)), decimals)
+        old_balance = self.balance[user]
+        sign = -1 if kind[0] == "DEBIT" else 1
+        new_balance = round(old_balance + sign * amount - vat, decimals)
+        self.balance[user] = new_balance
+
+        issue = None
+        if self.rng.random() < self.mismatch_rate:
+            issue = self.rng.choice(("calculation", "sync"))
+        logged_new_balance = new_balance
+        if issue == "calculation":
+            logged_new_balance = round(new_balance + self.rng.choice((-1, 1)) * self.rng.uniform(1, 50), decimals)
+
+        fields = {"id": self._ulid()}
+        if self.rng.random() >= UNTYPED_SHARE:
+            fields.update(type=kind[0], source=kind[1], action=kind[2], userId=user,
+                          paymentBalance=new_balance, updatePaymentBalance=True,
+                          metadata=json.dumps({"walletId": f"wallet#{user}", "walletSk": self._uuid(),
+                                               "version": "syncBalanceSQS"}, separators=(",", ":")))
+        else:
+            fields["userId"] = user
+        fields.update(currency=self.currency[user], amount=amount, vat=vat,
+                      oldBalance=old_balance, newBalance=logged_new_balance)
+        return fields, issue
+
+    def invocation(self, ts, sync=True):
+        """Log entries of one Lambda invocation, syncing one transaction unless sync=False."""
+        request_id = self._uuid()
+        step = timedelta(milliseconds=self.rng.randint(1, 40))
+        entries = [f"{iso(ts)} START RequestId: {request_id} Version: $LATEST"]
+        ts += step
+        entries.append(self._entry(ts, request_id, "INFO", f"Processing message {self._uuid()}"))
+
+        if not sync:
+            entries.append(self._entry(ts, request_id, "INFO", SKIP_MESSAGE))
+        else:
+            fields, issue = self.transaction()
+            if self.rng.random() < self.noise:
+                payload = {k: v for k, v in fields.items() if k not in ("oldBalance", "newBalance", "metadata")}
+                payload.update(userBalance=fields["newBalance"], notes="Synthetic benchmark transaction",
+                               createdAt=iso(ts - timedelta(seconds=20)))
+                entries.append(self._entry(ts, request_id, "INFO",
+                                           "transaction " + json.dumps(payload, separators=(",", ":"))))
+            ts += step
+            entries.append(self._entry(ts, request_id, "INFO",
+                                       "Start syncing the balance " + js_object({"transaction": fields})))
+            if issue == "sync":
+                payment = fields["newBalance"]
+                subscription = round(payment - self.rng.uniform(1, 500), 2)
+                ts += step
+                entries.append(self._entry(ts, request_id, "ERROR",
+                                           "Subscription balance and payment balance are not in sync " + js_object({
+                                               "userId": fields["userId"],
+                                               "subscriptionBalance": subscription,
+                                               "paymentBalance": payment,
+                                           })))
+                entries.append(f"{iso(ts)} " + json.dumps({
+                    "_aws": {"Timestamp": int(ts.timestamp() * 1000), "CloudWatchMetrics": [{
+                        "Namespace": "apiService", "Dimensions": [["service"]],
+                        "Metrics": [{"Name": "subBalanceDiscrapancy", "Unit": "Count"}]}]},
+                    "service": "syncBalanceSQS", "subBalanceDiscrapancy": 1, "userId": fields["userId"],
+                }, separators=(",", ":")))
+            if self.rng.random() < self.noise:
+                entries.append(self._entry(ts, request_id, "INFO", self.rng.choice(NOISE_MESSAGES)))
+
+        ts += step
+        duration = self.rng.uniform(10, 300)
+        entries.append(f"{iso(ts)} END RequestId: {request_id}")
+        entries.append(f"{iso(ts)} REPORT RequestId: {request_id}\tDuration: {duration:.2f} ms\t"
+                       f"Billed Duration: {int(duration) + 1} ms\tMemory Size: 1024 MB\t"
+                       f"Max Memory Used: {self.rng.randint(90, 120)} MB\t")
+        if self.rng.random() < self.noise:
+            entries.append(f"XRAY TraceId: 1-{self.rng.getrandbits(32):08x}-{self.rng.getrandbits(96):024x}\t"
+                           f"SegmentId: {self.rng.getrandbits(64):016x}\tSampled: true\t")
+        return entries
+
+    def stream(self, day, n_transactions):
+        """Text of one log stream opened on `day` syncing n_transactions."""
+        ts = datetime(day.year, day.month, day.day) + timedelta(seconds=self.rng.randint(0, 80000))
+        entries = [f"{iso(ts)} INIT_START Runtime Version: nodejs:14.v42\tRuntime Version ARN: {RUNTIME_ARN}"]
+        n_skips = sum(self.rng.random() < self.skip_rate for _ in range(n_transactions))
+        plan = [True] * n_transactions + [False] * n_skips
+        self.rng.shuffle(plan)
+        for sync in plan:
+            ts += timedelta(milliseconds=self.rng.randint(200, 60000))
+            entries.extend(self.invocation(ts, sync))
+        return "\n\n".join(entries) + "\n\n"
+
+
+def generate_corpus(out_dir, streams=BUNDLED_STREAMS, transactions=BUNDLED_TRANSACTIONS,
+                    users=BUNDLED_USERS, mismatch_rate=0.05, noise=0.5, skip_rate=BUNDLED_SKIP_RATE,
+                    start=BUNDLED_START, days=BUNDLED_DAYS, seed=0):
+    """
+    Write a synthetic corpus of `streams` log stream folders under out_dir
+    (see LogGenerator). Streams are spread over `days` days from `start`
+    and written in day order, so balance chains run forward in time.
+    Returns {"files", "transactions", "bytes", "gz_bytes"}.
+    """
+    generator = LogGenerator(users=users, mismatch_rate=mismatch_rate, noise=noise,
+                             skip_rate=skip_rate, seed=seed)
+    rng = random.Random(seed + 1)
+    stream_days = sorted(start + timedelta(days=rng.randrange(days)) for _ in range(streams))
+    # Spread transactions over streams; every stream syncs at least one
+    counts = [1] * streams
+    for _ in range(max(transactions - streams, 0)):
+        counts[rng.randrange(streams)] += 1
+
+    summary = {"files": 0, "transactions": 0, "bytes": 0, "gz_bytes": 0}
+    for day, count in zip(stream_days, counts):
+        folder = os.path.join(out_dir, f"{day.isoformat()}-[$LATEST]{rng.getrandbits(128):032x}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "000000.gz")
+        text = generator.stream(day, count)
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(text)
+        summary["files"] += 1
+        summary["transactions"] += count
+        summary["bytes"] += len(text)
+        summary["gz_bytes"] += os.path.getsize(path)
+    return summary
+
+
+def generate_scaled_corpus(out_dir, scale=1, **options):
+    """generate_corpus sized at `scale` times the bundled corpus (streams, transactions and users)."""
+    return generate_corpus(
+        out_dir,
+        streams=int(BUNDLED_STREAMS * scale),
+        transactions=int(BUNDLED_TRANSACTIONS * scale),
+        users=int(BUNDLED_USERS * scale),
+        **options
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic balance-sync Lambda log streams.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="size relative to the bundled corpus (default 1)")
+    parser.add_argument("--streams", type=int, help="log stream folders (overrides --scale)")
+    parser.add_argument("--transactions", type=int, help="synced transactions (overrides --scale)")
+    parser.add_argument("--users", type=int, help="distinct users (overrides --scale)")
+    parser.add_argument("--mismatch-rate", type=float, default=0.05)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--skip-rate", type=float, default=BUNDLED_SKIP_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    summary = generate_corpus(
+        args.out_dir,
+        streams=args.streams or int(BUNDLED_STREAMS * args.scale),
+        transactions=args.transactions or int(BUNDLED_TRANSACTIONS * args.scale),
+        users=args.users or int(BUNDLED_USERS * args.scale),
+        mismatch_rate=args.mismatch_rate,
+        noise=args.noise,
+        skip_rate=args.skip_rate,
+        seed=args.seed,
+    )
+    print(f"Generated {summary['files']} streams, {summary['transactions']} transactions, "
+          f"{summary['bytes'] / 1e6:.1f} MB ({summary['gz_bytes'] / 1e6:.1f} MB gzipped) in {args.out_dir}")
@@ -1,69 +1,302 @@
 import os
+import re
 import sys
 import gzip
+import time
+import hashlib
 from datetime import datetime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.storage.db_manager import Database
+from src.monitoring.metrics import instrumented, count
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for RAW_COMPRESSION=zstd
+    zstandard = None
 
 # Environment-based configuration
 LOGS_DIR = os.getenv("LOGS_DIR","Logs/balance-sync-logs/balance-sync-logs/a3fb6cdb-607b-469f-8f8a-ec4792e827cb")
 DB_PATH = os.getenv("DB_PATH", "data/transformed/calo_balances.db")
 
+# Batch budget: a batch is written and committed as soon as either limit is hit
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "200"))
+INGEST_BATCH_BYTES = int(os.getenv("INGEST_BATCH_BYTES", str(32 * 1024 * 1024)))
+GZ_CHUNK_SIZE = 1024 * 1024
+
+# How raw_data.raw_blob stores a file: "gzip" keeps the original .gz bytes,
+# "zstd" recompresses them (needs the zstandard package)
+RAW_COMPRESSION = os.getenv("RAW_COMPRESSION", "gzip")
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "10"))
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Legacy text rows converted per transaction by compress_raw_data
+COMPRESS_BATCH_ROWS = 200
+
+RAW_DATA_SCHEMA = {
+    "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "filename": "TEXT UNIQUE",
+    "raw_string": "TEXT",           # legacy: decoded text, NULL once raw_blob is set
+    "raw_blob": "BLOB",             # compressed file (see RAW_COMPRESSION)
+    "load_timestamp": "TEXT",
+    "content_hash": "TEXT"
+}
+
+# Files the direct mode (run_pipeline.py --direct) took from LOGS_DIR
+# straight into parsed_logs without archiving them in raw_data; size and
+# checksum (sha256 of the .gz file) make re-runs skip unchanged files
+DIRECT_FILES_SCHEMA = {
+    "filename": "TEXT PRIMARY KEY",
+    "size": "INTEGER",
+    "checksum": "TEXT",
+    "parsed_at": "TEXT"
+}
+
+# Log stream folders are named after the day they were opened:
+# 2024-04-03-[$LATEST]69c0410fd33b48d3a0684c9bfd8625f3
+STREAM_DATE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})")
+
+
 def read_gz_file(file_path):
     """
-    Safely read .gz file and decode as UTF-8.
+    Safely read .gz file and decode as UTF-8. The whole decoded file is
+    held in memory; ingestion itself stores files undecoded (read_raw_file).
     """
     with gzip.open(file_path, 'rt', encoding='utf-8', errors='replace') as f:
         return f.read()
 
 
-def load_files():
+def content_hash(raw):
+    """
+    Stable fingerprint of a raw log file as stored (compressed bytes, or
+    text for legacy rows), used by the parser to skip files it has already
+    parsed.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("zstd-compressed raw data needs the zstandard package (pip install zstandard)")
+
+
+def compress_raw(raw_text):
+    """Compress decoded log text for raw_blob with RAW_COMPRESSION."""
+    data = raw_text.encode("utf-8")
+    if RAW_COMPRESSION == "zstd":
+        _require_zstandard()
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, mtime=0)
+
+
+def read_raw_file(file_path):
+    """
+    Bytes of a .gz log file as stored in raw_blob: the file itself, or
+    recompressed with zstd. Nothing is decoded as a whole at load time.
+    """
+    if RAW_COMPRESSION == "zstd":
+        _require_zstandard()
+        # Decompressed chunk by chunk into the zstd frame, so the decoded
+        # file is never held whole
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        parts = []
+        with gzip.open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(GZ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parts.append(compressor.compress(chunk))
+        parts.append(compressor.flush())
+        return b"".join(parts)
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def decompress_raw(raw):
+    """
+    Decoded text of a stored raw file: gzip or zstd bytes (told apart by
+    their magic numbers) or the text of a legacy raw_string row.
+    """
+    if raw is None:
+        return ""
+    if isinstance(raw, str):
+        return raw
+    raw = bytes(raw)
+    if raw[:2] == GZIP_MAGIC:
+        data = gzip.decompress(raw)
+    elif raw[:4] == ZSTD_MAGIC:
+        _require_zstandard()
+        # Streamed frames (read_raw_file) don't record their content size
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    else:
+        data = raw
+    return data.decode("utf-8", errors="replace")
+
+
+def stream_date(folder_name):
+    """YYYY-MM-DD day of a log stream folder, or None if the name has no date."""
+    match = STREAM_DATE_PATTERN.match(folder_name)
+    return match.group(1) if match else None
+
+
+def ensure_raw_data(db):
+    db.ensure_table("raw_data", RAW_DATA_SCHEMA)
+    db.add_column_if_missing("raw_data", "content_hash", "TEXT")
+    db.add_column_if_missing("raw_data", "raw_blob", "BLOB")
+    compress_raw_data(db)
+
+
+def compress_raw_data(db):
+    """
+    Move raw_data rows loaded as text into compressed raw_blob, then VACUUM
+    so the file actually shrinks. A file that was parsed at its old content
+    hash stays parsed under the new one, so nothing is re-parsed.
+    Returns the number of rows converted.
+    """
+    # parsed_hash only exists once the parser has run (ensure_parse_status)
+    parsed_hash = "parsed_hash" if "parsed_hash" in db.get_table_schema("raw_data") else "NULL"
+    converted = 0
+    while True:
+        rows = db.connection.execute(
+            f"SELECT id, raw_string, content_hash, {parsed_hash} FROM raw_data "
+            "WHERE raw_string IS NOT NULL LIMIT ?", (COMPRESS_BATCH_ROWS,)
+        ).fetchall()
+        if not rows:
+            break
+        with db.transaction() as conn:
+            for row_id, raw_text, old_hash, last_parsed in rows:
+                blob = compress_raw(raw_text)
+                new_hash = content_hash(blob)
+                conn.execute(
+                    "UPDATE raw_data SET raw_blob = ?, raw_string = NULL, content_hash = ? WHERE id = ?",
+                    (blob, new_hash, row_id)
+                )
+                if last_parsed is not None and last_parsed == (old_hash or content_hash(raw_text)):
+                    # The reset-parse-status trigger just cleared it
+                    conn.execute("UPDATE raw_data SET parsed_hash = ? WHERE id = ?", (new_hash, row_id))
+        converted += len(rows)
+
+    if converted:
+        db.connection.execute("VACUUM")
+        print(f"Compressed {converted} raw_data rows into raw_blob.")
+    return converted
+
+
+def get_loaded_files(db):
+    """Set of raw_data filenames (log stream folders) already loaded."""
+    existing_df = db.execute_query("SELECT filename FROM raw_data")
+    return set(existing_df['filename']) if not existing_df.empty else set()
+
+
+def ensure_direct_files(db):
+    db.ensure_table("direct_files", DIRECT_FILES_SCHEMA)
+
+
+def get_direct_files(db):
+    """{filename: checksum} of the files the direct mode has parsed."""
+    existing_df = db.execute_query("SELECT filename, checksum FROM direct_files")
+    return dict(zip(existing_df['filename'], existing_df['checksum']))
+
+
+def record_direct_file(db, filename, size, checksum):
+    db.execute_write(
+        "INSERT OR REPLACE INTO direct_files (filename, size, checksum, parsed_at) VALUES (?, ?, ?, ?)",
+        (filename, size, checksum, datetime.utcnow().isoformat())
+    )
+
+
+def iter_log_files(already_loaded, since=None, min_age=None, logs_dir=None):
+    """
+    Walk logs_dir (default LOGS_DIR) and yield (folder_name, file_path) for
+    .gz files not yet loaded. `already_loaded` is updated as files are
+    yielded. since (YYYY-MM-DD) skips streams opened before that day, and
+    undated ones. min_age (seconds) skips files modified more recently than
+    that, which may still be being written; they are picked up by a later
+    call.
+    """
+    for root, dirs, files in os.walk(logs_dir or LOGS_DIR):
+        for file in files:
+            if not file.endswith(".gz"):
+                continue
+
+            folder_name = os.path.basename(root)
+            if folder_name in already_loaded:
+                continue
+            if since is not None and (stream_date(folder_name) or "") < since:
+                continue
+
+            file_path = os.path.join(root, file)
+            if min_age is not None and time.time() - os.path.getmtime(file_path) < min_age:
+                continue
+
+            already_loaded.add(folder_name)
+            yield folder_name, file_path
+
+
+def raw_data_row(folder_name, raw_blob):
+    return {
+        "filename": folder_name,
+        "raw_blob": raw_blob,
+        "load_timestamp": datetime.utcnow().isoformat(),
+        "content_hash": content_hash(raw_blob)
+    }
+
+
+def _flush_batch(db, batch):
     """
-    Bulk ingestion using Database class.
+    Insert and commit one batch of raw files. Returns number of rows written.
+    """
+    if not batch:
+        return 0
+    db.insert_rows_dynamic("raw_data", batch)
+    return len(batch)
+
+
+@instrumented()
+def load_files(batch_rows=INGEST_BATCH_ROWS, batch_bytes=INGEST_BATCH_BYTES, min_age=None, logs_dir=None):
+    """
+    Streaming ingestion using Database class.
     - Creates table if not exists
-    - Skips already loaded files
-    - Inserts in batch
+    - Skips already loaded files (and, with min_age, files modified in the
+      last min_age seconds)
+    - logs_dir defaults to LOGS_DIR
+    - Stores each file compressed (see RAW_COMPRESSION), undecoded
+    - Writes bounded batches (batch_rows files or ~batch_bytes stored),
+      committing each one, so memory stays flat regardless of LOGS_DIR size
+    Returns the number of files inserted.
     """
     # Use Database context manager (auto connect/close)
     with Database(DB_PATH) as db:
         # Ensure table exists
-        db.ensure_table("raw_data", {
-            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
-            "filename": "TEXT UNIQUE",
-            "raw_string": "TEXT",
-            "load_timestamp": "TEXT"
-        })
+        ensure_raw_data(db)
 
         # Get already loaded files
-        existing_df = db.execute_query("SELECT filename FROM raw_data")
-        already_loaded = set(existing_df['filename']) if not existing_df.empty else set()
-
-        inserts = []
-
-        # Walk through logs and prepare batch
-        for root, dirs, files in os.walk(LOGS_DIR):
-            for file in files:
-                if not file.endswith(".gz"):
-                    continue
-
-                folder_name = os.path.basename(root)
-                if folder_name in already_loaded:
-                    continue
-
-                file_path = os.path.join(root, file)
-                raw_content = read_gz_file(file_path)
-                inserts.append({
-                    "filename": folder_name,
-                    "raw_string": raw_content,
-                    "load_timestamp": datetime.utcnow().isoformat()
-                })
-
-        # Insert batch
-        if inserts:
-            db.insert_rows_dynamic("raw_data", inserts)
-
-        print(f"Ingestion complete. Inserted {len(inserts)} new files.")
+        already_loaded = get_loaded_files(db)
+
+        batch = []
+        pending_bytes = 0
+        inserted = 0
+
+        # Walk through logs, flushing each batch as soon as it fills up
+        for folder_name, file_path in iter_log_files(already_loaded, min_age=min_age, logs_dir=logs_dir):
+            raw_blob = read_raw_file(file_path)
+            batch.append(raw_data_row(folder_name, raw_blob))
+            pending_bytes += len(raw_blob)
+
+            if len(batch) >= batch_rows or pending_bytes >= batch_bytes:
+                inserted += _flush_batch(db, batch)
+                batch = []
+                pending_bytes = 0
+
+        # Insert remaining partial batch
+        inserted += _flush_batch(db, batch)
+
+        print(f"Ingestion complete. Inserted {inserted} new files.")
+        count("raw_data.files_inserted", inserted)
+        return inserted
 
 
 if __name__ == "__main__":
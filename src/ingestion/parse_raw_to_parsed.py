@@ -1,18 +1,22 @@
 import os
 import re
 import sys
-from datetime import datetime
+from datetime import date, datetime
 import ast
-import re
-import ast
-from datetime import datetime
-from collections import defaultdict
+import json
+import argparse
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.storage.db_manager import Database
+from src.ingestion.load_raw_logs import content_hash, decompress_raw
+from src.ingestion.payload_decoder import decode_payload, flatten_payload, new_stats
+from src.monitoring.metrics import instrumented, count
 
 
+@instrumented(describe=lambda log_string: {"bytes": len(log_string)})
 def parse_log_string(log_string):
     """
     Parse a multiline log string into single-line log entries grouped by timestamp.
@@ -45,6 +49,7 @@ def _clean_entry(entry_lines):
     return combined.strip()
 
 
+@instrumented()
 def filter_logs_by_keywords(logs, keywords=['START RequestId', 'Start syncing the balance', 'Subscription balance and payment balance are not in sync']):
     """
     Filter logs that contain any of the specified keywords.
@@ -96,7 +101,31 @@ def extract_info_dep(logs):
                 data["BalanceNotInSync"] = json_part  # fallback as raw text
     return data
 
-def extract_info(logs):
+def _decode_or_raw(json_part, decode, stats):
+    """Decoded payload dict, or the raw text if it is malformed (or decode=False)."""
+    if not decode:
+        return json_part
+    try:
+        parsed_data = decode_payload(json_part)
+    except ValueError:
+        if stats is not None:
+            stats["malformed"] += 1
+        return json_part
+    if stats is not None:
+        stats["decoded"] += 1
+    return parsed_data
+
+
+@instrumented()
+def extract_info(logs, stats=None, decode=True):
+    """
+    Group filtered log lines by RequestId and decode their payloads.
+
+    Payloads are decoded once with decode_payload; malformed ones are kept
+    as raw text for the tolerant scanner in manual_parse. decode=False keeps
+    every payload as raw text. stats (see payload_decoder.new_stats) is
+    updated with decoded/malformed counts.
+    """
     requestid_pattern = re.compile(r"RequestId:\s*([a-f0-9-]+)")
     id_inline_pattern = re.compile(r"\b([a-f0-9-]{36})\b")
 
@@ -131,14 +160,9 @@ def extract_info(logs):
         # --- Extract StartSyncBalance ---
         if "Start syncing the balance" in log:
             timestamp_str = log.split()[0]
-            dt = datetime.strptime(timestamp_str[:10], "%Y-%m-%d").date()
+            dt = date.fromisoformat(timestamp_str[:10])
             json_part = log.split("Start syncing the balance", 1)[-1].strip()
-
-            try:
-                parsed_data = ast.literal_eval(json_part)
-                parsed_data['is_start_balance_sync'] = 1
-            except Exception:
-                parsed_data = json_part
+            parsed_data = _decode_or_raw(json_part, decode, stats)
 
             grouped_data[current_request_id]["StartSyncBalance"].append({
                 "time": str(dt),
@@ -148,167 +172,526 @@ def extract_info(logs):
 
         elif "Subscription balance and payment balance are not in sync" in log:
             json_part = log.split("not in sync", 1)[-1].strip()
-
-            try:
-                parsed_data = ast.literal_eval(json_part)
-                #parsed_data['is_balance_not_sync'] = 1
-            except Exception:
-                parsed_data = json_part
+            parsed_data = _decode_or_raw(json_part, decode, stats)
 
             grouped_data[current_request_id]["BalanceNotInSync"].append(parsed_data)
 
     return list(grouped_data.values())
 
 
-def find_metadata_bounds(raw_str: str):
+# Normalisations applied to a payload repr before tokenizing, in order
+PAYLOAD_REPLACEMENTS = (
+    ("None", "null"),
+    ("True", "true"),
+    ("False", "false"),
+    ("[", ""),
+    ("\\'", "'"),      # remove escaped single quotes
+    ("'", '"'),        # use double quotes for JSON
+    ("\\\\", ""),      # remove stray backslashes
+)
+
+# One match per colon: group 1 is the text since the previous '{', ',' or
+# ':', group 2 the value up to the next ',' or '}' (looked ahead, not
+# consumed). The lookbehind keeps the scan linear: a match may only start
+# right after one of those characters (RESUME_PATTERN is anchored instead).
+PAIR_BODY = r"""([^{,:]*):(?=[ '"]*([^,}]*))"""
+PAIR_PATTERN = re.compile(r"(?<![^{,:])" + PAIR_BODY)
+RESUME_PATTERN = re.compile(PAIR_BODY)
+BRACE_PATTERN = re.compile(r"[{}]")
+
+
+def clean_payload(raw):
+    """Apply PAYLOAD_REPLACEMENTS to the stripped repr of a payload."""
+    s = str(raw).strip()
+    for old, new in PAYLOAD_REPLACEMENTS:
+        s = s.replace(old, new)
+    return s
+
+
+def metadata_bounds(s):
     """
-    Returns (start_index, end_index) of metadata JSON inside raw_str.
-    If not found, returns (None, None).
+    (start, end) of the first 'metadata' block in a cleaned payload, or
+    (-1, -1). Same bounds as the old find_metadata_bounds (see
+    bench_manual_parse.py), but only the braces of the block itself are
+    visited.
     """
-    # Clean string similar to manual_parse
-    s = (raw_str.strip()
-        .replace("None", "null")
-        .replace("True", "true")
-        .replace("False", "false")
-        .replace("\\'", "'")
-        .replace("'", '"')
-        .replace("\\\\", "")
-    )
-
-    # Locate 'metadata'
     meta_pos = s.find('metadata')
     if meta_pos == -1:
-        return None, None
-
-    # Find first '{' after 'metadata'
-    start = s.find("{", meta_pos)
+        return -1, -1
+    start = s.find('{', meta_pos)
     if start == -1:
-        return None, None
+        return -1, -1
+
+    depth = 0
+    for match in BRACE_PATTERN.finditer(s, start):
+        depth += 1 if match.group() == '{' else -1
+        if depth == 0:
+            return start, match.end()
+    return -1, -1
+
+
+def tokenize_payload(s):
+    """
+    Single pass key/value tokenizer for a cleaned payload string.
+
+    PAIR_PATTERN visits every colon once, left to right: the key is the text
+    since the last '{' or ',' and the value runs to the next ',' or '}'.
+    Colons whose value opens a nested '{' are skipped, and the metadata
+    block is jumped over as a whole. Produces the same dict as
+    manual_parse_dep in linear time.
+    """
+    result = {}
+    meta_start, meta_end = metadata_bounds(s)
+    key_start = 0
+    pos = 0
+    resumed = False
+
+    while True:
+        match = RESUME_PATTERN.match(s, pos) if resumed else None
+        resumed = match is not None
+        if not resumed:
+            match = PAIR_PATTERN.search(s, pos)
+            if match is None:
+                break
+        start, colon = match.span(1)
+
+        if meta_start < colon < meta_end:
+            # Resume after metadata; the next key may begin inside the block
+            key_start = max(s.rfind('{', 0, meta_end), s.rfind(',', 0, meta_end)) + 1
+            pos = meta_end
+            meta_start = meta_end = -1
+            resumed = True
+            continue
 
-    # Match braces to find end
-    brace_count = 0
-    for i in range(start, len(s)):
-        if s[i] == '{':
-            brace_count += 1
-        elif s[i] == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                return start, i+1  # return start and end index
+        # A match right after ':' (or straight after metadata) continues the
+        # current key segment
+        if not resumed and (start == 0 or s[start - 1] != ':'):
+            key_start = start
+        pos = colon + 1
+
+        value = match.group(2)
+        # Skip if nested dict starts here
+        if value[:1] == '{':
+            continue
+        key = s[key_start:colon].strip().strip("'\" ")
+        value = value.strip().strip("'\" ")
+        if key and value:
+            result[key] = value
+
+    return result
+
+
+def scan_record(record):
+    """Tolerant scanner: normalise the record repr and tokenize it."""
+    return tokenize_payload(clean_payload(record))
+
+
+def is_decoded(record):
+    """True if every payload of an extract_info record was decoded."""
+    return (all(isinstance(entry["data"], dict) for entry in record["StartSyncBalance"])
+            and all(isinstance(payload, dict) for payload in record["BalanceNotInSync"]))
+
+
+def flatten_record(record):
+    """
+    Flatten a fully decoded record into one transaction dict, in the same
+    key order the scanner produces: RequestId, then each StartSyncBalance
+    entry (time + payload), then each BalanceNotInSync payload.
+    """
+    result = {"RequestId": record["RequestId"]}
+    for entry in record["StartSyncBalance"]:
+        result["time"] = entry["time"]
+        flatten_payload(entry["data"], result)
+    for payload in record["BalanceNotInSync"]:
+        flatten_payload(payload, result)
+    return result
 
-    return None, None
 
+@instrumented()
+def manual_parse(raw_str, stats=None):
+    """
+    Flatten each extracted record into a key/value dict.
 
-def manual_parse(raw_str):
+    Decoded records are flattened directly with typed values; records with a
+    malformed payload fall back to the tolerant scanner (scan_record), which
+    is counted in stats["fallback_records"]. The original scanner,
+    manual_parse_dep, lives on in src/benchmark/bench_manual_parse.py.
+    """
     resultList = []
-    for r in raw_str:
-        # Remove outer braces if present
-        s = str(r).strip()
-        s = (s.replace("None", "null")
-            .replace("True", "true")
-            .replace("False", "false")
-            .replace("[", "")
-            .replace("\\'", "'")        # remove escaped single quotes
-            .replace("'", '"')          # use double quotes for JSON
-            .replace("\\\\", "")        # remove stray backslashes
+    for record in raw_str:
+        if is_decoded(record):
+            resultList.append(flatten_record(record))
+        else:
+            if stats is not None:
+                stats["fallback_records"] += 1
+            resultList.append(scan_record(record))
+    return resultList
+
+
+# Number of parser processes; 1 keeps everything in-process (serial path)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "1"))
+
+# raw_data files fetched per query when streaming pending files to the parser
+PARSE_FETCH_SIZE = 50
+
+
+def should_parse(filename, raw_text):
+    """Cheap pre-check on the decoded text, so unwanted files yield no rows."""
+    return filename not in ['.DS_Store', '000000.gz'] and "Start syncing the balance" in raw_text
+
+
+# Declared parsed_logs schema. Keys outside it are kept in the `extra` column
+# as a JSON object, so the table never grows new columns at parse time.
+PARSED_LOGS_SCHEMA = {
+    "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "filename": "TEXT",
+    "parsed_at": "TEXT",            # ISO-8601 UTC timestamp
+    "RequestId": "TEXT",
+    "transaction_id": "TEXT",
+    "userId": "TEXT",
+    "time": "TEXT",                 # ISO date (YYYY-MM-DD)
+    "type": "TEXT",
+    "action": "TEXT",
+    "source": "TEXT",
+    "currency": "TEXT",
+    "amount": "REAL",
+    "vat": "REAL",
+    "oldBalance": "REAL",
+    "newBalance": "REAL",
+    "paymentBalance": "REAL",
+    "subscriptionBalance": "REAL",
+    "updatePaymentBalance": "INTEGER",
+    "extra": "TEXT"                 # JSON object of undeclared keys
+}
+
+# Files whose parsed_logs rows were deleted since the last reconcile (see
+# ensure_stale_files)
+STALE_FILES_TABLE = "stale_parsed_files"
+
+
+def to_text(value):
+    """Render a decoded value for a TEXT column (booleans as logged, None as NULL)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def to_real(value):
+    """Numbers (decoded, or as text from the fallback scanner) for a REAL column."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"not a number: {value!r}")
+    return float(value)
+
+
+def to_flag(value):
+    """Booleans (decoded, or 'true'/'false' from the fallback scanner) as 0/1."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = {"true": True, "false": False}.get(value.strip(), value)
+    if not isinstance(value, bool):
+        raise ValueError(f"not a boolean: {value!r}")
+    return int(value)
+
+
+COLUMN_CONVERTERS = {"TEXT": to_text, "REAL": to_real, "INTEGER": to_flag}
+
+# Row keys that map onto a declared column (id and extra are managed here)
+TYPED_COLUMNS = {
+    col: COLUMN_CONVERTERS[dtype]
+    for col, dtype in PARSED_LOGS_SCHEMA.items()
+    if col not in ("id", "extra")
+}
+
+
+def to_parsed_row(tx):
+    """
+    Map one flattened transaction onto the parsed_logs schema.
+
+    Declared columns get typed values; undeclared keys, and values that don't
+    convert to their column type, are collected into the JSON `extra` column.
+    """
+    row = {}
+    extra = {}
+    for key, value in tx.items():
+        convert = TYPED_COLUMNS.get(key)
+        if convert is None:
+            extra[key] = value
+            continue
+        try:
+            row[key] = convert(value)
+        except (TypeError, ValueError):
+            row[key] = None
+            extra[key] = value
+    row["extra"] = json.dumps(extra, sort_keys=True, default=str) if extra else None
+    return row
+
+
+@instrumented(describe=lambda filename, raw: {"filename": filename, "bytes": len(raw)})
+def parse_file(filename, raw):
+    """
+    Parse one raw log file into a list of parsed_logs rows.
+
+    raw is the file as stored in raw_data (compressed bytes, or legacy text);
+    it is only decompressed here. Pure CPU work with no database access, so
+    it can run in a worker process, and only compressed bytes are shipped to
+    it. Returns (filename, rows, decoder stats), with rows None for files
+    should_parse rejects.
+    """
+    stats = new_stats()
+    raw_text = decompress_raw(raw)
+    if not should_parse(filename, raw_text):
+        return filename, None, stats
+
+    # Parse raw string -> list of transaction dicts
+    all_logs_in_list = parse_log_string(raw_text)
+    filtered_logs_in_list = filter_logs_by_keywords(all_logs_in_list)
+    data = extract_info(filtered_logs_in_list, stats)
+    all_transactions = manual_parse(data, stats)
+
+    return filename, to_parsed_rows(filename, all_transactions), stats
+
+
+@instrumented()
+def to_parsed_rows(filename, transactions):
+    """parsed_logs rows for the manual_parse transactions of one file."""
+    rows = []
+    for tx in transactions:
+        tx = dict(tx)
+        tx["transaction_id"] = tx.pop("id", None)
+        tx["filename"] = filename
+        rows.append(to_parsed_row(tx))
+    return rows
+
+
+def _parse_job(job):
+    return parse_file(*job)
+
+
+def iter_parsed_files(jobs, workers=1):
+    """
+    Yield parse_file results (filename, rows, stats) for (filename, raw)
+    jobs in input order.
+
+    With workers > 1 files are parsed in a process pool; at most a few
+    files per worker are in flight so memory stays bounded, and results are
+    yielded in submission order so the output matches the serial path.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield _parse_job(job)
+        return
+
+    window = workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for job in jobs:
+            in_flight.append(executor.submit(_parse_job, job))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def ensure_parse_status(db):
+    """
+    Track parse status per raw_data row.
+
+    - content_hash: sha256 of the stored file (written on load, refreshed on parse)
+    - parsed_hash: content_hash of the version last parsed into parsed_logs
+    A trigger clears parsed_hash whenever raw_blob (or a legacy raw_string)
+    is rewritten, so modified files are picked up again on the next
+    incremental run.
+    """
+    db.add_column_if_missing("raw_data", "content_hash", "TEXT")
+    db.add_column_if_missing("raw_data", "parsed_hash", "TEXT")
+    db.add_column_if_missing("raw_data", "raw_blob", "BLOB")
+    db.execute_write("""
+        CREATE TRIGGER IF NOT EXISTS raw_data_reset_parse_status
+        AFTER UPDATE OF raw_string ON raw_data
+        BEGIN
+            UPDATE raw_data SET parsed_hash = NULL WHERE id = NEW.id;
+        END
+    """)
+    db.execute_write("""
+        CREATE TRIGGER IF NOT EXISTS raw_data_reset_parse_status_blob
+        AFTER UPDATE OF raw_blob ON raw_data
+        BEGIN
+            UPDATE raw_data SET parsed_hash = NULL WHERE id = NEW.id;
+        END
+    """)
+
+
+def ensure_stale_files(db):
+    """
+    Log of files whose parsed_logs rows were deleted (re-parsed or removed)
+    since reconcile_events last caught up: a trigger records the filename
+    of every deleted row, and the incremental reconcile re-reconciles those
+    files and clears the table. Needs parsed_logs to exist.
+    """
+    db.ensure_table(STALE_FILES_TABLE, {"filename": "TEXT PRIMARY KEY"})
+    db.execute_write(f"""
+        CREATE TRIGGER IF NOT EXISTS parsed_logs_record_stale_file
+        AFTER DELETE ON parsed_logs
+        BEGIN
+            INSERT OR IGNORE INTO {STALE_FILES_TABLE} (filename) VALUES (OLD.filename);
+        END
+    """)
+
+
+def ensure_parsed_logs_schema(db):
+    """
+    Create parsed_logs with PARSED_LOGS_SCHEMA.
+
+    A parsed_logs table in any other shape (e.g. the old all-TEXT dynamic
+    columns) is dropped and every raw_data file is queued for re-parsing, so
+    the typed table is rebuilt by the normal incremental run (files of the
+    direct mode are forgotten too). Creating the table bumps its version
+    stamp.
+    """
+    existing = db.get_table_schema("parsed_logs")
+    declared = {col: dtype.split()[0] for col, dtype in PARSED_LOGS_SCHEMA.items()}
+    if existing != declared:
+        if existing:
+            print("parsed_logs schema changed; rebuilding it from raw_data.")
+            db.drop_table("parsed_logs")
+        db.execute_write("UPDATE raw_data SET parsed_hash = NULL")
+        if db.get_table_schema("direct_files"):
+            # Files parsed by the direct mode are read from LOGS_DIR again
+            db.execute_write("DELETE FROM direct_files")
+        db.ensure_table("parsed_logs", PARSED_LOGS_SCHEMA)
+        # A new table restarts ids; the incremental reconcile rebuilds on this stamp
+        db.bump_table_version("parsed_logs")
+
+    # Every re-parse first deletes the file's previous rows
+    db.execute_write("CREATE INDEX IF NOT EXISTS idx_parsed_logs_filename ON parsed_logs (filename)")
+    ensure_stale_files(db)
+
+
+def get_pending_files(db, full=False):
+    """
+    Return filenames (in load order) that need parsing: never parsed, or
+    changed since they were last parsed. full=True returns every file.
+    """
+    query = "SELECT filename FROM raw_data"
+    if not full:
+        query += """
+        WHERE parsed_hash IS NULL
+           OR content_hash IS NULL
+           OR parsed_hash != content_hash"""
+    query += " ORDER BY id"
+    return db.execute_query(query)["filename"].tolist()
+
+
+def iter_raw_files(db, filenames, fetch_size=PARSE_FETCH_SIZE):
+    """
+    Stream (filename, raw) for the given files, a few at a time, instead of
+    loading the whole raw_data table into memory. raw is the stored file,
+    still compressed (see decompress_raw); legacy rows give their text.
+    """
+    for i in range(0, len(filenames), fetch_size):
+        chunk = filenames[i:i + fetch_size]
+        placeholders = ", ".join(["?"] * len(chunk))
+        chunk_df = db.execute_query(
+            f"SELECT filename, COALESCE(raw_blob, raw_string) AS raw FROM raw_data "
+            f"WHERE filename IN ({placeholders}) ORDER BY id",
+            tuple(chunk)
         )
+        for filename, raw in chunk_df.itertuples(index=False):
+            yield filename, raw
 
-        start_meta, end_meta = find_metadata_bounds(s)
 
-        is_meta = True
-        if start_meta is None or end_meta is None:
-            is_meta = False
+def mark_parsed(db, filename, file_hash):
+    """Record that the current content of a raw_data file has been parsed."""
+    db.execute_write(
+        "UPDATE raw_data SET content_hash = ?, parsed_hash = ? WHERE filename = ?",
+        (file_hash, file_hash, filename)
+    )
 
-        colon_positions = [i for i, ch in enumerate(s) if ch == ':']
-        result = {}
 
-        for idx in colon_positions:
-            if is_meta:
-                if idx > start_meta and idx < end_meta:
-                    continue
+def replace_parsed_rows(db, filename, rows):
+    """
+    Replace the parsed_logs rows of one file with `rows`. Commits on its
+    own, or with the caller's db.transaction() block.
+    """
+    # Remove previous parsed rows for this file
+    db.delete_rows("parsed_logs", "filename = ?", (filename,))
 
-            # ---- Get key (scan left) ----
-            j = idx - 1
-            while j >= 0 and s[j] not in "{,":
-                j -= 1
-            key = s[j+1:idx].strip().strip("'\" ")
-        
-            # ---- Get value (scan right) ----
-            k = idx + 1
-            while k < len(s) and s[k] in " '\"":
-                k += 1
-            # Skip if nested dict starts here
-            if k < len(s) and s[k] == '{':
-                continue
-            # Otherwise, capture till comma or end
-            m = k
-            while m < len(s) and s[m] not in ",}":
-                m += 1
-            value = s[k:m].strip().strip("'\" ")
-        
-            if key and value:
-                result[key] = value
+    parsed_at = datetime.utcnow().isoformat()
+    for tx in rows:
+        tx["parsed_at"] = parsed_at
 
-        resultList.append(result)
-    return resultList 
+    if rows:
+        db.insert_rows_dynamic("parsed_logs", rows)
 
 
+def write_parsed_file(db, filename, rows, file_hash):
+    """
+    Replace the parsed_logs rows of one raw_data file with `rows` and record
+    the parsed content hash, in one transaction, so a crash never leaves a
+    file marked parsed without its rows.
+    """
+    with db.transaction():
+        replace_parsed_rows(db, filename, rows)
+        mark_parsed(db, filename, file_hash)
+
 
-def parse_raw_table_to_parsed_logs():
+@instrumented()
+def parse_raw_table_to_parsed_logs(workers=PARSE_WORKERS, full=False):
     """
     Parse raw logs from 'raw_data' table into structured 'parsed_logs' table.
 
     - Creates table if not exists (keeps history)
+    - Incremental: only files that are new or changed since their last parse
+      are read and re-parsed (full=True re-parses everything)
     - Deletes existing rows per file before re-parsing
-    - Dynamically adds new columns as needed
+    - Typed columns per PARSED_LOGS_SCHEMA; unknown keys go to the JSON
+      `extra` column instead of new columns
     - Batch insert for performance
+    - workers > 1 parses files in a process pool; this process stays the
+      single writer that owns the SQLite connection
     """
     with Database() as db:
-        # Ensure parsed_logs table exists
-        db.ensure_table("parsed_logs", {
-            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
-            "filename": "TEXT",
-            "parsed_at": "TEXT"
-        })
-
-        # Load raw_data
-        raw_df = db.select_table("raw_data")
-        if raw_df.empty:
-            print("No raw logs found in raw_data table.")
-            return
-
-        for _, row in raw_df.iterrows():
-            raw_text = row["raw_string"]
-            filename = row.get("filename")
+        ensure_parse_status(db)
+        # Ensure parsed_logs table exists with its typed schema
+        ensure_parsed_logs_schema(db)
 
-            # Skip unwanted files
-            if filename in ['.DS_Store', '000000.gz'] or "Start syncing the balance" not in raw_text:
-                continue
-
-            # Parse raw string -> list of transaction dicts
-            all_logs_in_list = parse_log_string(raw_text)
-            filtered_logs_in_list = filter_logs_by_keywords(all_logs_in_list)
-            data = extract_info(filtered_logs_in_list)
-            all_transactions = manual_parse(data)
-
-            # Remove previous parsed rows for this file
-            db.delete_rows("parsed_logs", "filename = ?", (filename,))
+        pending = get_pending_files(db, full=full)
+        if not pending:
+            print("No new or changed raw logs to parse.")
+            return
 
-            # Prepare batch insert
-            batch = []
-            for tx in all_transactions:
-                tx = dict(tx)
-                tx["transaction_id"] = tx.pop("id", None)
-                tx["filename"] = filename
-                tx["parsed_at"] = datetime.utcnow().isoformat()
+        # Hash of each file in flight, recorded once its rows are written
+        file_hashes = {}
 
-                # Convert all keys/values to string for SQLite
-                tx = {str(k): str(v) for k, v in tx.items()}
-                batch.append(tx)
+        def jobs():
+            for filename, raw in iter_raw_files(db, pending):
+                file_hashes[filename] = content_hash(raw)
+                yield filename, raw
 
-            if batch:
-                db.insert_rows_dynamic("parsed_logs", batch)
+        parsed_files = 0
+        decoder_stats = new_stats()
+        for filename, batch, file_stats in iter_parsed_files(jobs(), workers):
+            if batch is None:
+                # Nothing to extract, but don't read it again next run
+                mark_parsed(db, filename, file_hashes.pop(filename))
+                continue
+            decoder_stats.update(file_stats)
+            write_parsed_file(db, filename, batch, file_hashes.pop(filename))
+            parsed_files += 1
 
             print(f"{filename}: Inserted {len(batch)} transactions")
+            count("parsed_logs.rows_inserted", len(batch), filename=filename)
+
+        print(f"Parsing complete. {parsed_files} of {len(pending)} pending files had transactions.")
+        for name, value in decoder_stats.items():
+            count(f"payload_decoder.{name}", value)
+        print(f"Payload decoder: {decoder_stats['decoded']} decoded, {decoder_stats['malformed']} malformed, "
+              f"{decoder_stats['fallback_records']} records parsed by the fallback scanner.")
 
 
 # def parse_raw_table_to_parsed_logs():
@@ -375,4 +758,10 @@ def parse_raw_table_to_parsed_logs():
 
 
 if __name__ == "__main__":
-    parse_raw_table_to_parsed_logs()
+    parser = argparse.ArgumentParser(description="Parse raw_data into parsed_logs.")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="number of parser processes (default: PARSE_WORKERS env or 1)")
+    parser.add_argument("--full", action="store_true",
+                        help="re-parse every raw_data file instead of only new or changed ones")
+    args = parser.parse_args()
+    parse_raw_table_to_parsed_logs(workers=args.workers, full=args.full)
@@ -0,0 +1,89 @@
+import re
+import json
+from collections import Counter
+
+# Payloads in the Lambda logs are Node.js util.inspect output, e.g.
+#   { transaction: { id: '01HH..', amount: 22, updatePaymentBalance: true, metadata: '{"walletId":..}' } }
+# i.e. bare keys, single-quoted (or backtick-quoted, when the text holds both
+# quote kinds) strings and `undefined`. They are rewritten token by token into
+# JSON and decoded with json.loads in one go.
+TOKEN_PATTERN = re.compile(r"""'((?:[^'\\]|\\.)*)'|`((?:[^`\\]|\\.)*)`|"(?:[^"\\]|\\.)*"|([A-Za-z_$][\w$]*)""")
+JS_ESCAPE_PATTERN = re.compile(r"\\(.)")
+JS_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0"}
+# Characters that keep a string off the copy-as-is fast path
+NEEDS_ESCAPE_PATTERN = re.compile(r'["\\\x00-\x1f]')
+
+JSON_LITERALS = {"true", "false", "null"}
+
+# Keys whose values are opaque blobs and are never flattened into a record
+SKIP_KEYS = ("metadata",)
+
+
+def _unescape_js(text):
+    if "\\" not in text:
+        return text
+    return JS_ESCAPE_PATTERN.sub(lambda m: JS_ESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def _quote(text):
+    if NEEDS_ESCAPE_PATTERN.search(text) is None:
+        return '"' + text + '"'
+    return json.dumps(_unescape_js(text))
+
+
+def _rewrite_token(match):
+    group = match.lastindex
+    if group == 3:
+        word = match.group(3)
+        if word in JSON_LITERALS:
+            return word
+        if word == "undefined":
+            return "null"
+        return '"' + word + '"'
+    if group is None:
+        # Already a JSON string
+        return match.group(0)
+    return _quote(match.group(group))
+
+
+def decode_payload(text):
+    """
+    Decode one util.inspect payload into a (nested) dict of typed values.
+
+    Raises ValueError for anything that is not a single well-formed object,
+    e.g. truncated lines, trailing text or unquoted dates.
+    """
+    payload = json.loads(TOKEN_PATTERN.sub(_rewrite_token, text))
+    if not isinstance(payload, dict):
+        raise ValueError("payload is not an object")
+    return payload
+
+
+def flatten_payload(payload, out=None):
+    """
+    Flatten a decoded payload into a single level dict.
+
+    Nested objects are merged into the top level (later keys win), keys in
+    SKIP_KEYS are dropped, and scalars keep their decoded type.
+    """
+    if out is None:
+        out = {}
+    for key, value in payload.items():
+        if key in SKIP_KEYS:
+            continue
+        if isinstance(value, dict):
+            flatten_payload(value, out)
+        else:
+            out[key] = value
+    return out
+
+
+def new_stats():
+    """
+    Counters reported by the parser:
+    - decoded: payloads decoded by decode_payload
+    - malformed: payloads that failed to decode and were kept as raw text
+    - fallback_records: records sent to the tolerant scanner because at
+      least one of their payloads was malformed
+    """
+    return Counter(decoded=0, malformed=0, fallback_records=0)
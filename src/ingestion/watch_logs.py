@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.ingestion.load_raw_logs import LOGS_DIR, load_files
+from src.ingestion.parse_raw_to_parsed import PARSE_WORKERS, parse_raw_table_to_parsed_logs
+from src.transformation.reconcile_events import populate_reconcile_events
+
+# Seconds between scans when polling (and the longest a wait blocks, so the
+# daemon stays responsive to Ctrl+C)
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "5"))
+
+# A .gz file must be unchanged this long before it is loaded. After an
+# inotify event the daemon also waits this long, so a burst of writes (a new
+# stream folder and its file) is handled in one cycle.
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "2"))
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """
+    Wake-ups from Linux inotify on a directory tree, through libc with ctypes
+    (no extra dependency). inotify isn't recursive, so every folder gets its
+    own watch and folders created later are added as they appear.
+    """
+
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name or "libc.so.6", use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        try:
+            for folder, dirs, files in os.walk(root):
+                self._add_watch(folder)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            # ENOSPC: fs.inotify.max_user_watches is exhausted
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+        self._dirs[wd] = folder
+
+    def _read_events(self):
+        seen = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return seen
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name = buffer[offset:offset + length].rstrip(b"\0")
+                offset += length
+                seen = True
+                if mask & IN_DELETE_SELF:
+                    self._dirs.pop(wd, None)
+                elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self._dirs:
+                    new_folder = os.path.join(self._dirs[wd], os.fsdecode(name))
+                    # Watch it, and any folders that were created inside it
+                    # before the watch existed
+                    for folder, dirs, files in os.walk(new_folder):
+                        self._add_watch(folder)
+
+    def wait(self, timeout):
+        """
+        Block up to timeout seconds; True if anything changed under the root.
+        Consumes the queued events, so changes made after this returns wake
+        the next wait.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(ready) and self._read_events()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Fallback for platforms without inotify: every wait ends in a scan."""
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return True
+
+    def close(self):
+        pass
+
+
+def make_watcher(root, polling=False):
+    if not polling:
+        try:
+            return InotifyWatcher(root)
+        except OSError as e:
+            print(f"inotify unavailable ({e}); polling {root} every {WATCH_POLL_INTERVAL:g}s.")
+    return PollingWatcher()
+
+
+def sync_new_streams(workers=PARSE_WORKERS, settle=WATCH_SETTLE_SECONDS):
+    """
+    Load stream folders that appeared since the last run, then run the
+    incremental parse and reconcile. Those run even when nothing was loaded,
+    so files loaded by a cycle whose parse or reconcile failed are picked up
+    by the next one; with nothing pending both return almost at once.
+    Returns the number of files loaded.
+    """
+    inserted = load_files(min_age=settle)
+    parse_raw_table_to_parsed_logs(workers=workers)
+    populate_reconcile_events()
+    return inserted
+
+
+def watch(polling=False, interval=WATCH_POLL_INTERVAL, settle=WATCH_SETTLE_SECONDS, workers=PARSE_WORKERS):
+    """
+    Long-running ingestion: catch up once, then load, parse and reconcile
+    new .gz stream folders under LOGS_DIR as they appear, using inotify
+    wake-ups (or polling every `interval` seconds as a fallback). Each
+    step is incremental, so a cycle only touches the new folders.
+    """
+    watcher = make_watcher(LOGS_DIR, polling)
+    mode = "polling" if isinstance(watcher, PollingWatcher) else "inotify"
+    print(f"Watching {LOGS_DIR} ({mode}).")
+    try:
+        # Catch up first. A sync skips files modified in the last `settle`
+        # seconds, so a sync after a change is followed by a rescan once
+        # the next wait times out
+        sync = rescan = True
+        while True:
+            try:
+                if sync:
+                    sync_new_streams(workers, settle)
+                # Waiting can fail too, e.g. ENOSPC watching a new day folder
+                changed = watcher.wait(interval)
+                if changed and mode == "inotify":
+                    # Let the writer finish the burst, then handle it in one go
+                    time.sleep(settle)
+                sync, rescan = changed or rescan, changed
+            except Exception as e:
+                # Keep watching; a full scan retries the files after the
+                # usual interval
+                print(f"Watch cycle failed: {e}")
+                time.sleep(interval)
+                sync = rescan = True
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously ingest new Lambda log streams from LOGS_DIR.")
+    parser.add_argument("--poll", action="store_true",
+                        help="poll LOGS_DIR instead of using inotify")
+    parser.add_argument("--interval", type=float, default=WATCH_POLL_INTERVAL,
+                        help="seconds between polls (default: WATCH_POLL_INTERVAL env or 5)")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS,
+                        help="seconds a file must be unchanged before it is loaded (default: WATCH_SETTLE_SECONDS env or 2)")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="number of parser processes (default: PARSE_WORKERS env or 1)")
+    args = parser.parse_args()
+    watch(polling=args.poll, interval=args.interval, settle=args.settle, workers=args.workers)
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import functools
+import tracemalloc
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+# JSON-lines metrics sink: a file path (appended to) or "-" for stderr.
+# Unset, instrumentation is off and `instrumented` returns functions as-is.
+METRICS_PATH = os.getenv("METRICS_PATH", "")
+
+# Optional hooks, comma-separated: "cprofile" dumps a .prof file per
+# outermost instrumented call into METRICS_PROFILE_DIR, "tracemalloc" adds
+# Python memory figures to every timer record.
+METRICS_PROFILE = {hook.strip() for hook in os.getenv("METRICS_PROFILE", "").split(",") if hook.strip()}
+METRICS_PROFILE_DIR = os.getenv("METRICS_PROFILE_DIR", "metrics_profiles")
+
+ENABLED = bool(METRICS_PATH)
+
+_write_lock = threading.Lock()
+# Per-thread nesting depth of timers; cProfile and the tracemalloc peak only
+# cover the outermost one, as neither nests
+_local = threading.local()
+# (pid, file) so a forked worker opens its own handle
+_sink = None
+_profile_counter = 0
+
+
+def _open_sink():
+    global _sink
+    pid = os.getpid()
+    if _sink is None or _sink[0] != pid:
+        if METRICS_PATH == "-":
+            handle = sys.stderr
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(METRICS_PATH)), exist_ok=True)
+            # Line buffered, appended: each record is a single write, so
+            # records from several processes don't interleave
+            handle = open(METRICS_PATH, "a", buffering=1, encoding="utf-8")
+        _sink = (pid, handle)
+    return _sink[1]
+
+
+def emit(metric, kind, **fields):
+    """Write one metrics record (a no-op while instrumentation is off)."""
+    if not ENABLED:
+        return
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "metric": metric,
+        "type": kind,
+        "pid": os.getpid(),
+    }
+    record.update(fields)
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        _open_sink().write(line)
+
+
+def count(metric, value=1, **fields):
+    """Record a counter increment, e.g. rows written or files skipped."""
+    emit(metric, "counter", value=value, **fields)
+
+
+def _profile_path(metric):
+    global _profile_counter
+    with _write_lock:
+        _profile_counter += 1
+        n = _profile_counter
+    os.makedirs(METRICS_PROFILE_DIR, exist_ok=True)
+    return os.path.join(METRICS_PROFILE_DIR, f"{metric}-{os.getpid()}-{n}.prof")
+
+
+@contextmanager
+def timer(metric, **fields):
+    """
+    Time a block and emit a "timer" record with its wall and CPU seconds,
+    whether it raised, and the optional profiling hooks' output.
+    """
+    if not ENABLED:
+        yield fields
+        return
+
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    outermost = depth == 0
+
+    profiler = None
+    if "cprofile" in METRICS_PROFILE and outermost:
+        profiler = cProfile.Profile()
+    trace = "tracemalloc" in METRICS_PROFILE
+    if trace:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if outermost:
+            tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+
+    error = None
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        # Callers may add fields (e.g. row counts) to the dict while timing
+        yield fields
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record = dict(
+            fields,
+            seconds=round(time.perf_counter() - started, 6),
+            cpu_seconds=round(time.process_time() - cpu_started, 6),
+        )
+        if error:
+            record["error"] = error
+        if trace:
+            current, peak = tracemalloc.get_traced_memory()
+            record["memory_delta"] = current - memory_before
+            if outermost:
+                record["memory_peak"] = peak
+        if profiler is not None:
+            record["profile"] = _profile_path(metric)
+            profiler.dump_stats(record["profile"])
+        _local.depth = depth
+        emit(metric, "timer", **record)
+
+
+def instrumented(metric=None, describe=None):
+    """
+    Decorator timing every call of a function (see timer). metric defaults
+    to the function name; describe(*args, **kwargs) may return extra fields
+    for the record, e.g. a table name and row count. With instrumentation
+    off the function is returned unwrapped, so it costs nothing.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        name = metric or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            fields = describe(*args, **kwargs) if describe is not None else {}
+            with timer(name, **fields):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
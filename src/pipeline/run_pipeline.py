@@ -0,0 +1,333 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import date
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.db_manager import Database
+from src.ingestion.load_raw_logs import (
+    read_raw_file, content_hash, stream_date, ensure_raw_data, get_loaded_files,
+    iter_log_files, raw_data_row, ensure_direct_files, get_direct_files, record_direct_file
+)
+from src.ingestion.parse_raw_to_parsed import (
+    PARSE_WORKERS, _parse_job, ensure_parse_status, ensure_parsed_logs_schema,
+    get_pending_files, iter_raw_files, mark_parsed, write_parsed_file, replace_parsed_rows
+)
+from src.ingestion.payload_decoder import new_stats
+from src.transformation.reconcile_events import populate_reconcile_events
+from src.monitoring.metrics import instrumented, count, emit
+
+# Files buffered between two stages; bounds memory to a few files per stage
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+# End of stream marker passed down the queues
+DONE = None
+
+STAGES = ("load", "parse", "write", "reconcile")
+
+
+def new_stage_stats():
+    return {stage: {"files": 0, "bytes": 0, "rows": 0, "busy": None} for stage in STAGES}
+
+
+def record(stats, stage, started, files=1, nbytes=0, rows=0, busy=None):
+    """
+    Count one unit of work of a stage that began at `started` and just
+    finished. busy is the time the stage spent on it, when that isn't the
+    time since `started` (a parse waits in the pool before it runs).
+    """
+    entry = stats[stage]
+    entry["files"] += files
+    entry["bytes"] += nbytes
+    entry["rows"] += rows
+    entry["busy"] = (entry["busy"] or 0.0) + (time.perf_counter() - started if busy is None else busy)
+
+
+def format_stage_stats(stats):
+    """
+    One line per stage. Times and rates are over the stage's busy time, the
+    sum of the time spent on each of its files, so stages that overlap each
+    show their own cost rather than the whole run's.
+    """
+    lines = []
+    for stage, entry in stats.items():
+        if entry["busy"] is None:
+            lines.append(f"{stage}: nothing to do")
+            continue
+        elapsed = max(entry["busy"], 1e-9)
+        if not entry["files"]:
+            lines.append(f"{stage}: {elapsed:.2f}s")
+            continue
+        mb = entry["bytes"] / (1024 * 1024)
+        totals = [f"{entry['files']} files"]
+        rates = [f"{entry['files'] / elapsed:.0f} files/s"]
+        if entry["bytes"]:
+            totals.append(f"{mb:.1f} MB")
+            rates.append(f"{mb / elapsed:.1f} MB/s")
+        if entry["rows"]:
+            totals.append(f"{entry['rows']} rows")
+            rates.append(f"{entry['rows'] / elapsed:.0f} rows/s")
+        lines.append(f"{stage}: {', '.join(totals)} in {elapsed:.2f}s ({', '.join(rates)})")
+    return lines
+
+
+def emit_stage_metrics(stats, decoder_stats):
+    """
+    Metrics of a run: a "pipeline.<stage>" timer per stage with its busy
+    time and totals, and the payload_decoder counters the step-by-step
+    parse emits.
+    """
+    for stage, entry in stats.items():
+        if entry["busy"] is not None:
+            emit(f"pipeline.{stage}", "timer", seconds=round(entry["busy"], 6),
+                 files=entry["files"], bytes=entry["bytes"], rows=entry["rows"])
+    for name, value in decoder_stats.items():
+        count(f"payload_decoder.{name}", value)
+
+
+def _timed_parse_job(job):
+    """_parse_job and the seconds it took, measured in the worker."""
+    started = time.perf_counter()
+    result = _parse_job(job)
+    return time.perf_counter() - started, result
+
+
+def _read_gz(file_path):
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return data, content_hash(data)
+
+
+def _iter_new_files(loaded, since, logs_dir, direct):
+    """
+    For each .gz file iter_log_files finds, (folder_name, (bytes, checksum))
+    when direct, else (folder_name, its raw_data row).
+    """
+    for folder_name, file_path in iter_log_files(loaded, since, logs_dir=logs_dir):
+        if direct:
+            yield folder_name, _read_gz(file_path)
+        else:
+            yield folder_name, raw_data_row(folder_name, read_raw_file(file_path))
+
+
+def _timed_next(iterator):
+    """next(iterator, DONE) and the seconds it took, for a thread to run."""
+    started = time.perf_counter()
+    item = next(iterator, DONE)
+    return time.perf_counter() - started, item
+
+
+async def _in_thread(iterator):
+    """
+    Yield (busy, item) for each item of a blocking iterator, advanced in a
+    thread so the loop keeps parsing and writing meanwhile. busy is the
+    time the thread spent on the item.
+    """
+    while True:
+        busy, item = await asyncio.to_thread(_timed_next, iterator)
+        if item is DONE:
+            return
+        yield busy, item
+
+
+async def load_stage(db, out_queue, stats, since=None, direct=False, logs_dir=None):
+    """
+    Feed (filename, raw, file_hash, raw_row) downstream: first the
+    raw_data files still waiting to be parsed (raw_row None), then new .gz
+    files from logs_dir (default LOGS_DIR). raw stays compressed until the
+    parse stage; byte counts are stored bytes.
+
+    Directory walks, file reads and raw_data reads run in a thread, the
+    raw_data ones on a pooled read-only connection (the writer's can't
+    leave the loop's thread), so the other stages keep running.
+
+    direct=True only feeds .gz files, never archived in raw_data, whose
+    checksum differs from the one recorded in direct_files (raw_row None).
+    """
+    loaded = get_loaded_files(db)
+    if direct:
+        parsed = get_direct_files(db)
+        async for busy, (folder_name, (data, checksum)) in _in_thread(
+                _iter_new_files(loaded, since, logs_dir, direct=True)):
+            if parsed.get(folder_name) == checksum:
+                continue
+            record(stats, "load", None, nbytes=len(data), busy=busy)
+            await out_queue.put((folder_name, data, checksum, None))
+        await out_queue.put(DONE)
+        return
+
+    pending = get_pending_files(db)
+    if since is not None:
+        pending = [name for name in pending if (stream_date(name) or "") >= since]
+    if pending:
+        with Database(db.db_name, read_only=True) as reader:
+            async for busy, (filename, raw) in _in_thread(iter_raw_files(reader, pending)):
+                started = time.perf_counter()
+                file_hash = content_hash(raw)
+                record(stats, "load", started, nbytes=len(raw), busy=busy + time.perf_counter() - started)
+                await out_queue.put((filename, raw, file_hash, None))
+
+    async for busy, (folder_name, row) in _in_thread(_iter_new_files(loaded, since, logs_dir, direct=False)):
+        record(stats, "load", None, nbytes=len(row["raw_blob"]), busy=busy)
+        await out_queue.put((folder_name, row["raw_blob"], row["content_hash"], row))
+
+    await out_queue.put(DONE)
+
+
+async def parse_stage(in_queue, out_queue, stats, workers=1):
+    """
+    Parse files and pass them on in input order, so parsed_logs ids come
+    out as in the step-by-step pipeline. Files should_parse rejects are
+    passed on with rows None.
+
+    - workers <= 1 parses on the loop, like parse_raw_to_parsed.py: the
+      load stage's reads still overlap it in their thread, and no process
+      pool is started or fed pickled files
+    - workers > 1 parses in a process pool, a few files in flight per
+      worker
+    """
+    if workers <= 1:
+        while True:
+            item = await in_queue.get()
+            if item is DONE:
+                break
+            started = time.perf_counter()
+            _, rows, file_stats = _parse_job((item[0], item[1]))
+            record(stats, "parse", started, nbytes=len(item[1]), rows=len(rows or ()))
+            await out_queue.put(item + (rows, file_stats))
+        await out_queue.put(DONE)
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    window = workers * 2
+    in_flight = deque()
+
+    async def emit():
+        started, item, future = in_flight.popleft()
+        busy, (_, rows, file_stats) = await future
+        record(stats, "parse", started, nbytes=len(item[1]), rows=len(rows or ()), busy=busy)
+        await out_queue.put(item + (rows, file_stats))
+
+    try:
+        while True:
+            item = await in_queue.get()
+            if item is DONE:
+                break
+            future = loop.run_in_executor(executor, _timed_parse_job, (item[0], item[1]))
+            in_flight.append((time.perf_counter(), item, future))
+            if len(in_flight) >= window:
+                await emit()
+        while in_flight:
+            await emit()
+    finally:
+        executor.shutdown()
+    await out_queue.put(DONE)
+
+
+async def write_stage(db, in_queue, stats, decoder_stats, direct=False):
+    """
+    The single writer: store new raw files and replace each file's
+    parsed_logs rows, one file at a time as results arrive. In direct mode
+    only the file's size and checksum are kept, in direct_files.
+    """
+    while True:
+        item = await in_queue.get()
+        if item is DONE:
+            break
+        started = time.perf_counter()
+        filename, raw, file_hash, raw_row, rows, file_stats = item
+        if direct:
+            # Also clears the rows of a file that no longer has transactions
+            with db.transaction():
+                replace_parsed_rows(db, filename, rows or [])
+                record_direct_file(db, filename, len(raw), file_hash)
+        else:
+            if raw_row is not None:
+                db.insert_rows_dynamic("raw_data", [raw_row])
+                count("raw_data.files_inserted", 1, filename=filename)
+            if rows is None:
+                # Nothing to extract, but don't read it again next run
+                mark_parsed(db, filename, file_hash)
+            else:
+                write_parsed_file(db, filename, rows, file_hash)
+        if rows:
+            count("parsed_logs.rows_inserted", len(rows), filename=filename)
+        decoder_stats.update(file_stats)
+        record(stats, "write", started, nbytes=len(raw), rows=len(rows or ()))
+        # Give the load and parse stages a turn between files
+        await asyncio.sleep(0)
+
+
+async def run_stages(db, stats, decoder_stats, since=None, workers=PARSE_WORKERS, direct=False, logs_dir=None):
+    raw_files = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    parsed_files = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    await asyncio.gather(
+        load_stage(db, raw_files, stats, since, direct, logs_dir),
+        parse_stage(raw_files, parsed_files, stats, workers),
+        write_stage(db, parsed_files, stats, decoder_stats, direct),
+    )
+
+
+@instrumented()
+def run_pipeline(since=None, workers=PARSE_WORKERS, reconcile=True, direct=False, logs_dir=None):
+    """
+    Load, parse and reconcile in one process.
+
+    - Load, parse and write are stages connected by bounded queues, so one
+      file is being read (in a thread) while the previous one is parsed and
+      the one before that is written
+    - Picks up both new .gz files in LOGS_DIR (or logs_dir) and raw_data
+      files that are not parsed yet, like load_raw_logs.py followed by
+      parse_raw_to_parsed.py
+    - direct=True skips the raw_data archive: .gz files go straight into
+      parsed_logs and only their filename, size and checksum are recorded
+      (direct_files), so unchanged files are skipped on the next run.
+      Streams already archived in raw_data are left to the normal path
+    - since (YYYY-MM-DD) only takes log streams opened on or after that day
+    - reconcile_events is then updated incrementally
+    - Prints per-stage busy time and throughput, and emits them as metrics
+      (emit_stage_metrics) along with the raw_data and parsed_logs counters
+      of the step-by-step scripts
+    """
+    stats = new_stage_stats()
+    decoder_stats = new_stats()
+    started = time.perf_counter()
+
+    with Database() as db:
+        ensure_raw_data(db)
+        ensure_parse_status(db)
+        ensure_parsed_logs_schema(db)
+        ensure_direct_files(db)
+        asyncio.run(run_stages(db, stats, decoder_stats, since, workers, direct, logs_dir))
+
+    if reconcile:
+        reconcile_started = time.perf_counter()
+        populate_reconcile_events()
+        record(stats, "reconcile", reconcile_started, files=0)
+
+    emit_stage_metrics(stats, decoder_stats)
+    print(f"Payload decoder: {decoder_stats['decoded']} decoded, {decoder_stats['malformed']} malformed, "
+          f"{decoder_stats['fallback_records']} records parsed by the fallback scanner.")
+    for line in format_stage_stats(stats):
+        print(line)
+    print(f"Pipeline complete in {time.perf_counter() - started:.2f}s.")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load, parse and reconcile balance sync logs in one process.")
+    parser.add_argument("--since", type=lambda value: date.fromisoformat(value).isoformat(), default=None,
+                        help="only process log streams opened on or after this day (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="number of parser processes (default: PARSE_WORKERS env or 1)")
+    parser.add_argument("--no-reconcile", action="store_true",
+                        help="stop after parsing; don't update reconcile_events")
+    parser.add_argument("--direct", action="store_true",
+                        help="parse .gz files straight into parsed_logs without archiving them in raw_data")
+    args = parser.parse_args()
+    run_pipeline(since=args.since, workers=args.workers, reconcile=not args.no_reconcile, direct=args.direct)
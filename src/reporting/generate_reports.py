@@ -0,0 +1,249 @@
+import io
+import os
+import csv
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+from datetime import date, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.db_manager import Database
+from src.storage.reconcile_queries import NO_ROW_ISSUE, ROW_ISSUE_SQL, TABLE_COLUMNS
+from src.monitoring.metrics import instrumented, count
+
+# Where report files go, one folder per report (see REPORTS)
+REPORTS_DIR = os.getenv("REPORTS_DIR", "data/reports")
+
+# {report file path relative to REPORTS_DIR: fingerprint of the period it was
+# generated from}; the leading underscore keeps it apart from the reports
+MANIFEST_FILE = "_manifest.json"
+
+# Period start of a reconcile_events `timestamp` (a day): the day itself, or
+# the Monday of its week
+PERIOD_START_SQL = {
+    "day": "timestamp",
+    "week": "date(timestamp, 'weekday 0', '-6 days')",
+}
+PERIOD_DAYS = {"day": 1, "week": 7}
+
+# Aggregates a period's fingerprint is built from, per (country,
+# mismatch_type) of its rows. parsed_logs ids are never reused
+# (AUTOINCREMENT) and a re-parse replaces a file's rows, so a sum of mixed
+# parsed_log_ids changes with any copied column; the derived columns are
+# summed, and a CHAIN BREAK relabel moves its row to another group. Sums are
+# rounded so summation order can't change a fingerprint.
+FINGERPRINT_AGGREGATES = (
+    "COUNT(*)",
+    "SUM(parsed_log_id * 2654435761 % 4294967291)",
+    "ROUND(TOTAL(expected_new_balance), 6)",
+    "SUM(is_overdraft)",
+)
+
+# Overdrawn transactions of one day, in table order
+OVERDRAFT_QUERY = f"""
+    SELECT {', '.join(TABLE_COLUMNS)}
+    FROM reconcile_events
+    WHERE is_overdraft = 1 AND timestamp BETWEEN ? AND ?
+    ORDER BY rowid
+"""
+
+# Reconciliation summary of one week, per country and mismatch type.
+# mismatch_amount and anomalies follow the dashboard's definitions
+# (new_balance - expected_new_balance, a reported row-level issue off by at
+# least 0.5).
+WEEKLY_SUMMARY_QUERY = f"""
+    SELECT
+        ? AS week,
+        country,
+        mismatch_type,
+        COUNT(*) AS events,
+        COUNT(DISTINCT user_id) AS users,
+        SUM(is_overdraft = 1) AS overdraft_events,
+        SUM({ROW_ISSUE_SQL} AND ROUND(new_balance - expected_new_balance) != 0) AS anomalies,
+        ROUND(TOTAL(new_balance), 2) AS new_balance_sum,
+        ROUND(TOTAL(expected_new_balance), 2) AS expected_new_balance_sum,
+        ROUND(TOTAL(new_balance - expected_new_balance), 2) AS mismatch_amount
+    FROM reconcile_events
+    WHERE timestamp BETWEEN ? AND ?
+    GROUP BY country, mismatch_type
+    ORDER BY country, mismatch_type
+"""
+
+
+def overdraft_rows(db, start, end):
+    return db.connection.execute(OVERDRAFT_QUERY, (start, end))
+
+
+def weekly_summary_rows(db, start, end):
+    return db.connection.execute(WEEKLY_SUMMARY_QUERY, (iso_week(start), *NO_ROW_ISSUE, start, end))
+
+
+def iso_week(day):
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+# name -> (period, file name of a period start, rows(db, start, end), the
+# reconcile_events rows it reads as a WHERE condition). Only periods with
+# such rows get a file, and only changes to them rewrite it.
+REPORTS = {
+    "daily_overdraft": ("day", lambda start: f"overdraft_{start}.csv.gz", overdraft_rows, "is_overdraft = 1"),
+    "weekly_reconciliation": ("week", lambda start: f"reconciliation_{iso_week(start)}.csv.gz",
+                              weekly_summary_rows, "timestamp IS NOT NULL"),
+}
+
+
+def period_start(period, day):
+    """First day (YYYY-MM-DD) of the period containing `day`."""
+    value = date.fromisoformat(day)
+    if period == "week":
+        value -= timedelta(days=value.weekday())
+    return value.isoformat()
+
+
+def period_fingerprints(db, period, predicate, since=None):
+    """
+    {period start: fingerprint} of every period with reconcile_events rows
+    matching predicate, aggregated in SQL (FINGERPRINT_AGGREGATES per
+    period, country and mismatch_type), so a report is only regenerated
+    when one of its rows was added, removed or changed, e.g. a re-parsed
+    transaction_id or a CHAIN BREAK relabel.
+
+    - Only the groups reach Python; the fingerprint is the period's row
+      count and a digest of its groups
+    - since limits the scan to the periods from the one containing it
+    """
+    where, params = ("AND timestamp >= ?", [period_start(period, since)]) if since else ("", [])
+    cursor = db.connection.execute(f"""
+        SELECT {PERIOD_START_SQL[period]} AS period, country, mismatch_type, {', '.join(FINGERPRINT_AGGREGATES)}
+        FROM reconcile_events
+        WHERE {predicate} {where}
+        GROUP BY period, country, mismatch_type
+        ORDER BY period, country, mismatch_type
+    """, params)
+    # period -> [row count, digest of its groups]
+    periods = {}
+    for start, *group in cursor:
+        entry = periods.setdefault(start, [0, hashlib.blake2b(digest_size=8)])
+        entry[0] += group[2]
+        entry[1].update(f"{group!r}\n".encode("utf-8"))
+    return {start: f"{rows}:{digest.hexdigest()}" for start, (rows, digest) in periods.items()}
+
+
+def load_manifest(reports_dir):
+    try:
+        with open(os.path.join(reports_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(reports_dir, manifest):
+    path = os.path.join(reports_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def remove_obsolete(reports_dir, manifest, name, current):
+    """
+    Delete the files of report `name` in the manifest that are not in
+    `current`, e.g. a day that no longer has overdrafts. Returns how many.
+    """
+    obsolete = [key for key in manifest if key.startswith(f"{name}/") and key not in current]
+    for key in obsolete:
+        try:
+            os.remove(os.path.join(reports_dir, key))
+        except FileNotFoundError:
+            pass
+        del manifest[key]
+    return len(obsolete)
+
+
+def write_csv_gz(path, cursor):
+    """
+    Stream a cursor's rows into a gzipped CSV with its column names as
+    header. Written under a temporary name and renamed, so a report file is
+    never half-written.
+    """
+    tmp = f"{path}.tmp"
+    rows = 0
+    with open(tmp, "wb") as f, \
+            gzip.GzipFile(filename=os.path.basename(path)[:-len(".gz")], mode="wb", fileobj=f, mtime=0) as gz, \
+            io.TextIOWrapper(gz, encoding="utf-8", newline="") as text:
+        writer = csv.writer(text, lineterminator="\n")
+        writer.writerow([column[0] for column in cursor.description])
+        for row in cursor:
+            writer.writerow(row)
+            rows += 1
+    os.replace(tmp, path)
+    return rows
+
+
+@instrumented()
+def generate_reports(names=tuple(REPORTS), since=None, force=False, reports_dir=None):
+    """
+    Write each report in `names` for every period with reconcile_events rows.
+
+    - One gzipped CSV per period: REPORTS_DIR/<report>/<file>.csv.gz
+    - Only periods with rows the report reads (e.g. overdrafts) get a file
+    - Periods whose file exists and whose fingerprint (SQL aggregates of
+      those rows, see period_fingerprints) is unchanged are skipped;
+      force=True rewrites them
+    - Each remaining period is a single range query on reconcile_events
+    - Files of periods that no longer have such rows are removed
+    - since (YYYY-MM-DD) limits the run, fingerprints included, to periods
+      from the one containing it, and skips the removal
+    Returns {report: (written, skipped)}.
+    """
+    reports_dir = reports_dir or REPORTS_DIR
+    os.makedirs(reports_dir, exist_ok=True)
+    manifest = load_manifest(reports_dir)
+    results = {}
+    with Database(read_only=True) as db:
+        if not db.get_table_schema("reconcile_events"):
+            print("No reconcile_events yet; run src/transformation/reconcile_events.py first.")
+            return results
+        try:
+            for name in names:
+                period, file_name, rows, predicate = REPORTS[name]
+                os.makedirs(os.path.join(reports_dir, name), exist_ok=True)
+                written = skipped = 0
+                current = set()
+                for start, fingerprint in period_fingerprints(db, period, predicate, since).items():
+                    key = f"{name}/{file_name(start)}"
+                    current.add(key)
+                    path = os.path.join(reports_dir, key)
+                    if not force and manifest.get(key) == fingerprint and os.path.exists(path):
+                        skipped += 1
+                        continue
+                    end = (date.fromisoformat(start) + timedelta(days=PERIOD_DAYS[period] - 1)).isoformat()
+                    count("reports.rows", write_csv_gz(path, rows(db, start, end)), report=name)
+                    manifest[key] = fingerprint
+                    written += 1
+                removed = 0 if since else remove_obsolete(reports_dir, manifest, name, current)
+                results[name] = (written, skipped)
+                count("reports.files", written, report=name)
+                print(f"{name}: {written} written, {skipped} up to date, {removed} removed, "
+                      f"in {os.path.join(reports_dir, name)}")
+        finally:
+            save_manifest(reports_dir, manifest)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write daily overdraft and weekly reconciliation reports.")
+    parser.add_argument("--reports", default=",".join(REPORTS),
+                        help=f"comma-separated reports to generate (default: {','.join(REPORTS)})")
+    parser.add_argument("--since", type=lambda value: date.fromisoformat(value).isoformat(), default=None,
+                        help="only periods from the one containing this day (YYYY-MM-DD)")
+    parser.add_argument("--force", action="store_true", help="rewrite reports that are up to date")
+    parser.add_argument("--reports-dir", default=None, help="output folder (default: REPORTS_DIR env or data/reports)")
+    args = parser.parse_args()
+    names = [name.strip() for name in args.reports.split(",") if name.strip()]
+    unknown = set(names) - set(REPORTS)
+    if unknown:
+        parser.error(f"unknown reports: {', '.join(sorted(unknown))}")
+    generate_reports(names, since=args.since, force=args.force, reports_dir=args.reports_dir)
@@ -1,13 +1,103 @@
 import sqlite3
 import pandas as pd
 from pathlib import Path
+from contextlib import contextmanager
 import os
+import sys
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.monitoring.metrics import instrumented, count
+
+# Idle read-only connections kept per database file (per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# Applied once per connection; journal_mode=WAL is stored in the database
+# file, so read-only connections don't need to set it
+PERFORMANCE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;",    # Balance durability/perf
+    "PRAGMA temp_store=MEMORY;",     # Temp data in memory
+    "PRAGMA mmap_size=30000000000;", # 30 GB memory mapping (safe fallback)
+)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only connections to one database file.
+
+    Connections are opened with check_same_thread=False so a connection can
+    be handed from the thread that released it to the next one acquiring it;
+    it is only ever used by the thread holding it. Connections are opened
+    with query_only=ON, so a write through a pooled connection fails instead
+    of taking the write lock. At most `size` idle connections are kept.
+    Reuses and new connections are counted as db_pool.hit / db_pool.miss.
+    """
+
+    def __init__(self, db_name, size=DB_POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            connection = sqlite3.connect(self.db_name, check_same_thread=False)
+            for pragma in PERFORMANCE_PRAGMAS:
+                connection.execute(pragma)
+            connection.execute("PRAGMA query_only=ON;")
+        except sqlite3.Error as e:
+            raise Exception(f"Error connecting to database: {e}")
+        return connection
+
+    def acquire(self):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is not None:
+            count("db_pool.hit", db=self.db_name)
+            return connection
+        count("db_pool.miss", db=self.db_name)
+        return self._open()
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+# (pid, db_name) -> ConnectionPool. Keyed on the pid so a forked worker
+# (e.g. gunicorn with --preload) never reuses its parent's connections.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name):
+    key = (os.getpid(), db_name)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_name)
+        return pool
+
 
 class Database:
 
-    def __init__(self, db_name=None):
+    def __init__(self, db_name=None, read_only=False):
         """
         Initialize Database with optional db_name or environment variable DB_PATH.
+
+        read_only=True borrows a pooled read-only connection (see
+        ConnectionPool) for the `with` block instead of opening one; use it
+        for dashboard reads. Writers get their own dedicated connection.
         """
         env_db_path = os.getenv("DB_PATH")
         if env_db_path:
@@ -21,15 +111,26 @@ class Database:
                 db_name = os.path.join(project_root, "data/transformed/calo.db")
 
         self.db_name = db_name
+        self.read_only = read_only
         self.connection = None
+        # Set inside transaction(): the helpers' own commits are deferred
+        self._in_transaction = False
 
     # --- Context manager support ---
     def __enter__(self):
-        self.connect()
+        if self.read_only:
+            self.connection = get_pool(self.db_name).acquire()
+        else:
+            self.connect()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.close_connection()
+        if self.read_only:
+            if self.connection:
+                get_pool(self.db_name).release(self.connection)
+                self.connection = None
+        else:
+            self.close_connection()
 
     # --- Connection handling ---
     def connect(self):
@@ -45,9 +146,8 @@ class Database:
             # Apply performance PRAGMAs
             cursor = self.connection.cursor()
             cursor.execute("PRAGMA journal_mode=WAL;")      # Better concurrency
-            cursor.execute("PRAGMA synchronous=NORMAL;")    # Balance durability/perf
-            cursor.execute("PRAGMA temp_store=MEMORY;")     # Temp data in memory
-            cursor.execute("PRAGMA mmap_size=30000000000;") # 30 GB memory mapping (safe fallback)
+            for pragma in PERFORMANCE_PRAGMAS:
+                cursor.execute(pragma)
             cursor.close()
 
         except sqlite3.Error as e:
@@ -58,6 +158,32 @@ class Database:
             self.connection.close()
             self.connection = None
 
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block of statements as one write transaction (BEGIN IMMEDIATE
+        ... COMMIT, rolled back on error). Readers keep seeing the previous
+        committed state until the block commits, DDL included.
+        insert_rows_dynamic, execute_write and delete_rows leave their
+        commit to the block; other helpers that commit would end it early.
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self._in_transaction = False
+
+    def _commit(self):
+        """Commit, unless a transaction() block will."""
+        if not self._in_transaction:
+            self.connection.commit()
+
     # --- Schema management ---
     def create_table(self, table_name, columns_dict):
         """
@@ -80,6 +206,16 @@ class Database:
         """
         self.create_table(table_name, schema)
 
+    def get_table_schema(self, table_name: str):
+        """
+        Return {column: declared type} for a table, or {} if it doesn't exist.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        schema = {row[1]: row[2] for row in cursor.fetchall()}
+        cursor.close()
+        return schema
+
     def add_column_if_missing(self, table_name: str, column_name: str, dtype: str = "TEXT"):
         """
         Add a column to an existing table if it doesn't exist.
@@ -123,6 +259,7 @@ class Database:
         except sqlite3.Error as e:
             print(f"Error bulk inserting into {table_name}: {e}")
 
+    @instrumented(describe=lambda self, table_name, rows: {"table": table_name, "rows": len(rows)})
     def insert_rows_dynamic(self, table_name: str, rows: list):
         """
         Insert rows into table dynamically adding columns if new keys are found.
@@ -143,9 +280,9 @@ class Database:
         for row in rows:
             all_keys.update(row.keys())
 
-        # Add missing columns
+        # Add missing columns (sorted so the schema is deterministic run to run)
         new_cols = all_keys - existing_cols
-        for col in new_cols:
+        for col in sorted(new_cols):
             try:
                 cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN '{col}' TEXT")
             except sqlite3.OperationalError as e:
@@ -155,7 +292,7 @@ class Database:
                     raise
 
         # Prepare insert
-        cols_order = list(all_keys)
+        cols_order = sorted(all_keys)
         placeholders = ", ".join(["?"] * len(cols_order))
         col_names_str = ", ".join([f"'{c}'" for c in cols_order])
 
@@ -170,7 +307,7 @@ class Database:
             f"INSERT INTO {table_name} ({col_names_str}) VALUES ({placeholders})",
             values
         )
-        self.connection.commit()
+        self._commit()
 
     # --- Query methods ---
     def select_table(self, table_name):
@@ -180,7 +317,7 @@ class Database:
         columns = [col[0] for col in cursor.description]
         return pd.DataFrame(rows, columns=columns)
 
-    def execute_query(self, query):
+    def execute_query(self, query, params=None):
         """
         Execute a raw SQL query and return the result as a pandas DataFrame.
         """
@@ -189,7 +326,7 @@ class Database:
 
         cursor = self.connection.cursor()
         try:
-            cursor.execute(query)
+            cursor.execute(query, params or ())
             columns = [description[0] for description in cursor.description]
             rows = cursor.fetchall()
             return pd.DataFrame(rows, columns=columns)
@@ -197,6 +334,67 @@ class Database:
             print(f"Error executing query: {e}")
             raise
 
+    def execute_write(self, query, params=None):
+        """
+        Execute a single write statement (UPDATE/INSERT/DDL) and commit.
+        """
+        if self.connection is None:
+            raise Exception("Database connection is not established. Call connect() first.")
+
+        self.connection.execute(query, params or ())
+        self._commit()
+
+    def swap_table(self, table_name, shadow_name, finish=None):
+        """
+        Atomically replace table_name with a fully built shadow table: in one
+        transaction the live table is dropped, the shadow renamed into its
+        place and finish(conn) run (e.g. to create indexes under their usual
+        names). WAL readers keep reading the old generation, without
+        blocking, until the commit.
+        """
+        with self.transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(f"ALTER TABLE {shadow_name} RENAME TO {table_name}")
+            if finish is not None:
+                finish(conn)
+
+    # --- Table versions ---
+    def get_table_version(self, table_name):
+        """
+        Return the version stamp of a table, or 0 if it was never bumped.
+        """
+        try:
+            cursor = self.connection.execute(
+                "SELECT version FROM table_versions WHERE table_name = ?", (table_name,)
+            )
+        except sqlite3.OperationalError:
+            # table_versions is created by the first bump
+            return 0
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def bump_table_version(self, table_name):
+        """
+        Increment a table's version stamp so readers caching it know the data
+        was rewritten. Returns the new version.
+        """
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at TEXT
+            )
+        """)
+        self.connection.execute("""
+            INSERT INTO table_versions (table_name, version, updated_at)
+            VALUES (?, 1, datetime('now'))
+            ON CONFLICT(table_name) DO UPDATE SET
+                version = version + 1,
+                updated_at = excluded.updated_at
+        """, (table_name,))
+        self.connection.commit()
+        return self.get_table_version(table_name)
+
     # --- Deletion / Drop ---
     def delete_rows(self, table_name, where_clause=None, params=None):
         """
@@ -215,7 +413,7 @@ class Database:
             query += f" WHERE {where_clause}"
 
         self.connection.execute(query, params or ())
-        self.connection.commit()
+        self._commit()
 
     def drop_table(self, table_name):
         """
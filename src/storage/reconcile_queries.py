@@ -0,0 +1,259 @@
+import re
+import pandas as pd
+
+# Filters accepted by build_where, in the order they are applied. Each maps to
+# an indexed column of reconcile_events (see RECONCILE_EVENTS_INDEXES in
+# src/transformation/reconcile_events.py).
+IN_FILTERS = (
+    ("user_ids", "user_id"),
+    ("countries", "country"),
+    ("mismatch_types", "mismatch_type"),
+    ("overdraft", "is_overdraft"),
+)
+
+NO_ISSUE = "NO FOUND ISSUE"
+# Set from the per-user ledger on rows without a row-level issue (see
+# src/transformation/user_ledger.py)
+CHAIN_BREAK = "CHAIN BREAK"
+# Mismatch types of rows without a row-level issue. A chain break is a gap
+# to the user's previous row, so row-level figures (the summary, anomalies,
+# mismatch running totals) leave it out as they do NO FOUND ISSUE.
+NO_ROW_ISSUE = (NO_ISSUE, CHAIN_BREAK)
+ROW_ISSUE_SQL = "mismatch_type NOT IN (?, ?)"
+
+# Columns of the reconciliation DataTable; the only columns its filter_query
+# and sort_by may reference
+TABLE_COLUMNS = (
+    "timestamp", "mismatch_type", "transaction_id", "type", "user_id", "country",
+    "old_balance", "amount", "vat", "new_balance", "paymentBalance", "subscriptionBalance"
+)
+NUMERIC_COLUMNS = {"old_balance", "amount", "vat", "new_balance", "paymentBalance", "subscriptionBalance"}
+
+# One `{column} operator value` term of a DataTable filter_query. Operators may
+# carry the table's case prefix: s (sensitive) or i (insensitive).
+FILTER_TERM_PATTERN = re.compile(
+    r"""^\{(?P<column>[^}]+)\}\s+(?P<case>[si]?)(?P<op>contains|datestartswith|eq|ne|lt|le|gt|ge|!=|<=|>=|=|<|>)\s+(?P<value>.+)$"""
+)
+FILTER_OPERATORS = {
+    "eq": "=", "=": "=", "ne": "!=", "!=": "!=",
+    "lt": "<", "<": "<", "le": "<=", "<=": "<=",
+    "gt": ">", ">": ">", "ge": ">=", ">=": ">=",
+}
+
+
+def to_iso_date(value):
+    """Normalise a date picker value ('2024-03-01' or '2024-03-01T00:00:00') to YYYY-MM-DD."""
+    if value is None or value == "":
+        return None
+    return pd.to_datetime(value).date().isoformat()
+
+
+def _as_list(value):
+    if value is None or value == "" or value == []:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def _filter_value(column, raw):
+    raw = raw.strip()
+    if len(raw) > 1 and raw[0] == raw[-1] and raw[0] in "'\"`":
+        raw = raw[1:-1].replace("\\" + raw[0], raw[0])
+    if column in NUMERIC_COLUMNS:
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def parse_filter_query(filter_query):
+    """
+    Translate a DataTable filter_query ('{amount} s> 100 && {country} scontains Bah')
+    into SQL clauses and parameters.
+
+    Only TABLE_COLUMNS are accepted, values are always bound as parameters,
+    and terms that don't parse (or compare a numeric column with text) are
+    ignored, as the table does while a filter is being typed.
+    """
+    clauses = []
+    params = []
+    if not filter_query:
+        return clauses, params
+
+    for term in filter_query.split(" && "):
+        match = FILTER_TERM_PATTERN.match(term.strip())
+        if not match or match.group("column") not in TABLE_COLUMNS:
+            continue
+        column, op = match.group("column"), match.group("op")
+        insensitive = match.group("case") == "i"
+        value = _filter_value(column, match.group("value"))
+
+        if op == "contains":
+            if insensitive:
+                clauses.append(f"instr(LOWER({column}), LOWER(?)) > 0")
+            else:
+                clauses.append(f"instr({column}, ?) > 0")
+            params.append(str(value))
+        elif op == "datestartswith":
+            clauses.append(f"substr({column}, 1, length(?)) = ?")
+            params.extend([str(value), str(value)])
+        elif column in NUMERIC_COLUMNS and not isinstance(value, float):
+            # Half-typed numeric filter; SQLite would compare it as text
+            continue
+        else:
+            collate = " COLLATE NOCASE" if insensitive and isinstance(value, str) else ""
+            clauses.append(f"{column} {FILTER_OPERATORS[op]} ?{collate}")
+            params.append(value)
+    return clauses, params
+
+
+def build_order_by(sort_by, default="rowid"):
+    """ORDER BY expression for a DataTable sort_by list, restricted to TABLE_COLUMNS."""
+    terms = [
+        f"{item['column_id']} {'DESC' if item.get('direction') == 'desc' else 'ASC'}"
+        for item in (sort_by or [])
+        if item.get("column_id") in TABLE_COLUMNS
+    ]
+    # rowid last keeps page boundaries stable between requests
+    return ", ".join(terms + [default])
+
+
+def build_where(user_ids=None, countries=None, mismatch_types=None, overdraft=None,
+                start_date=None, end_date=None, mismatches_only=False, filter_query=None,
+                date_column="timestamp"):
+    """
+    Build a WHERE clause and its parameters for reconcile_events.
+
+    List filters become `col IN (?, ...)` (a single value is accepted too),
+    dates become a `timestamp` range on YYYY-MM-DD strings, and
+    mismatches_only drops rows without a row-level issue (NO_ROW_ISSUE) and filter_query adds the
+    DataTable's own column filters (see parse_filter_query). Empty filters
+    are skipped. date_column names the date column of tables other than
+    reconcile_events (e.g. the daily rollup's `date`). Returns ("WHERE ..." or "", params).
+    """
+    values = {
+        "user_ids": user_ids,
+        "countries": countries,
+        "mismatch_types": mismatch_types,
+        "overdraft": overdraft,
+    }
+    clauses = []
+    params = []
+
+    for name, column in IN_FILTERS:
+        selected = _as_list(values[name])
+        if selected:
+            clauses.append(f"{column} IN ({', '.join(['?'] * len(selected))})")
+            params.extend(selected)
+
+    if mismatches_only:
+        clauses.append(ROW_ISSUE_SQL)
+        params.extend(NO_ROW_ISSUE)
+
+    start = to_iso_date(start_date)
+    if start:
+        clauses.append(f"{date_column} >= ?")
+        params.append(start)
+    end = to_iso_date(end_date)
+    if end:
+        clauses.append(f"{date_column} <= ?")
+        params.append(end)
+
+    table_clauses, table_params = parse_filter_query(filter_query)
+    clauses.extend(table_clauses)
+    params.extend(table_params)
+
+    if not clauses:
+        return "", params
+    return "WHERE " + " AND ".join(clauses), params
+
+
+def query_reconcile_events(db, columns="*", order_by=None, limit=None, offset=0, **filters):
+    """
+    Select reconcile_events rows matching filters (see build_where) with the
+    filtering done by SQLite, so the indexes on the filter columns are used.
+    limit/offset fetch a single page.
+    """
+    where, params = build_where(**filters)
+    query = f"SELECT {columns} FROM reconcile_events {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params = params + [int(limit), int(offset)]
+    return db.execute_query(query, params)
+
+
+def count_reconcile_events(db, **filters):
+    """Number of reconcile_events rows matching filters."""
+    where, params = build_where(**filters)
+    return int(db.execute_query(f"SELECT COUNT(*) AS n FROM reconcile_events {where}", params)["n"].iloc[0])
+
+
+def date_bounds(db):
+    """(first, last) reconcile_events timestamp as YYYY-MM-DD strings, or (None, None)."""
+    row = db.execute_query("SELECT MIN(timestamp) AS first, MAX(timestamp) AS last FROM reconcile_events").iloc[0]
+    return row["first"], row["last"]
+
+
+def distinct_values(db, column, table="reconcile_events", **filters):
+    """Sorted distinct non-null values of a reconcile_events (or rollup) column, for dropdown options."""
+    where, params = build_where(**filters)
+    where = f"{where} AND {column} IS NOT NULL" if where else f"WHERE {column} IS NOT NULL"
+    df = db.execute_query(f"SELECT DISTINCT {column} FROM {table} {where} ORDER BY {column}", params)
+    return df[column].tolist()
+
+
+# Row-level condition behind the reconciliation summary: a reported row-level
+# issue whose new balance doesn't follow from old balance, amount and VAT
+SUMMARY_MISMATCH = f"{ROW_ISSUE_SQL} AND new_balance != old_balance + amount - vat"
+
+
+def summarize_reconcile_events(db, **filters):
+    """
+    Reconciliation summary of the rows matching filters, aggregated in SQL:
+
+    - users: distinct users with a SUMMARY_MISMATCH row
+    - total_mismatch: sum of new_balance - (old_balance + amount - vat) over
+      those rows
+    - last_sync: latest timestamp with a reported row-level issue (None if none)
+    """
+    where, params = build_where(**filters)
+    query = f"""
+        SELECT
+            COUNT(DISTINCT CASE WHEN {SUMMARY_MISMATCH} THEN user_id END) AS users,
+            TOTAL(CASE WHEN {SUMMARY_MISMATCH} THEN new_balance - (old_balance + amount - vat) END) AS total_mismatch,
+            MAX(CASE WHEN {ROW_ISSUE_SQL} THEN timestamp END) AS last_sync
+        FROM reconcile_events {where}
+    """
+    row = db.execute_query(query, [*NO_ROW_ISSUE] * 3 + params).iloc[0]
+    return {
+        "users": int(row["users"]),
+        "total_mismatch": float(row["total_mismatch"]),
+        "last_sync": row["last_sync"],
+    }
+
+
+def running_totals(db, **filters):
+    """
+    Daily running totals of new_balance (actual) and expected_new_balance
+    (expected) over the rows matching filters, read from the
+    reconcile_daily_rollup table rather than from individual events.
+    One row per date: date, cumulative_actual, cumulative_expected.
+    """
+    where, params = build_where(date_column="date", **filters)
+    query = f"""
+        SELECT
+            date,
+            SUM(actual) OVER (ORDER BY date) AS cumulative_actual,
+            SUM(expected) OVER (ORDER BY date) AS cumulative_expected
+        FROM (
+            SELECT date, TOTAL(new_balance_sum) AS actual, TOTAL(expected_new_balance_sum) AS expected
+            FROM reconcile_daily_rollup {where}
+            GROUP BY date
+        )
+        ORDER BY date
+    """
+    return db.execute_query(query, params)
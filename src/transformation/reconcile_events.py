@@ -1,15 +1,68 @@
 import os
 import sys
+import argparse
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.storage.db_manager import Database
+from src.ingestion.parse_raw_to_parsed import STALE_FILES_TABLE, ensure_stale_files
+from src.transformation.reconcile_rollups import refresh_daily_rollup
+from src.transformation.reconcile_snapshot import write_reconcile_snapshot, track_partitions, touched_partitions
+from src.transformation.user_ledger import (
+    LEDGER_TABLE,
+    USER_LEDGER_SCHEMA,
+    rebuild_user_ledger,
+    update_user_ledger,
+)
+from src.monitoring.metrics import instrumented
 
-def populate_reconcile_events():
-    db = Database()
-    db.connect()
+# Declared reconcile_events schema, so column types don't depend on what
+# pandas infers from a given batch
+RECONCILE_EVENTS_SCHEMA = {
+    "type": "TEXT",
+    "filename": "TEXT",
+    "RequestId": "TEXT",
+    "transaction_id": "TEXT",
+    "user_id": "TEXT",
+    "timestamp": "TEXT",
+    "old_balance": "REAL",
+    "amount": "REAL",
+    "vat": "REAL",
+    "new_balance": "REAL",
+    "is_overdraft": "INTEGER",
+    "expected_new_balance": "REAL",
+    "mismatch_type": "TEXT",
+    "paymentBalance": "REAL",
+    "subscriptionBalance": "REAL",
+    "source": "TEXT",
+    "action": "TEXT",
+    "country": "TEXT",
+    "parsed_log_id": "INTEGER"      # parsed_logs.id the row was reconciled from
+}
 
-    # Reconciliation query with COALESCE and country mapping
-    query = """
+# Indexes matched to the dashboard filter paths (user, country, mismatch type,
+# overdraft, date range). The composite index also carries the columns the
+# reconciliation summary reads, so filtered summaries are answered from the
+# index alone.
+RECONCILE_EVENTS_INDEXES = {
+    "idx_reconcile_events_user_id": ("user_id", "timestamp"),
+    "idx_reconcile_events_mismatch_type": ("mismatch_type", "timestamp"),
+    "idx_reconcile_events_is_overdraft": ("is_overdraft", "timestamp"),
+    "idx_reconcile_events_timestamp": ("timestamp",),
+    "idx_reconcile_events_country_mismatch_ts": (
+        "country", "mismatch_type", "timestamp",
+        "user_id", "old_balance", "amount", "vat", "new_balance"
+    ),
+    # Incremental maintenance (stale rows by file / by source row)
+    "idx_reconcile_events_filename": ("filename",),
+    "idx_reconcile_events_parsed_log_id": ("parsed_log_id",),
+}
+
+
+# Reconciliation query with COALESCE and country mapping, over the parsed_logs
+# rows with id > ? and all remaining rows of stale files (STALE_FILES_TABLE).
+# parsed_logs balance columns are REAL, so ROUND/COALESCE here only define
+# the 2-decimal comparison and missing-as-zero rules, they don't cast text.
+RECONCILE_QUERY = """
     SELECT 
         COALESCE(transformed_type, 'UNKNOWN') AS type,
         filename,
@@ -57,7 +110,8 @@ def populate_reconcile_events():
         subscriptionBalance,
         source,
         action,
-        country
+        country,
+        id AS parsed_log_id
 
     FROM (
         SELECT 
@@ -84,10 +138,12 @@ def populate_reconcile_events():
             subscriptionBalance,
             source,
             action,
-            country
+            country,
+            id
 
         FROM (
             SELECT 
+                id,
                 type,
                 COALESCE(ROUND(oldBalance, 2), 0) AS oldBalance,
                 COALESCE(ROUND(amount, 2), 0) AS amount,
@@ -113,18 +169,213 @@ def populate_reconcile_events():
 
             FROM parsed_logs
             WHERE time IS NOT NULL
+              AND (id > ? OR filename IN (SELECT filename FROM stale_parsed_files))
         ) base
-    ) type_base;
+    ) type_base
+"""
+
+# Blue/green rebuilds are built here and renamed to reconcile_events
+RECONCILE_SHADOW_TABLE = "reconcile_events_next"
+
+# Per-run copy of the reconcile_events rows of stale files, staged once and
+# used by the delete, the rollup's first day and the ledger update
+STALE_ROWS_TABLE = "temp.reconcile_stale"
+
+
+def ensure_reconcile_indexes(conn):
+    """
+    Create the reconcile_events indexes (if missing) and refresh the planner
+    statistics, on a connection inside the caller's transaction. After a
+    rebuild they are created once the table is loaded (and swapped in, so
+    they keep their usual names): building an index once is cheaper than
+    maintaining it row by row during the load.
+    """
+    for name, columns in RECONCILE_EVENTS_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON reconcile_events ({', '.join(columns)})")
+    conn.execute("ANALYZE reconcile_events")
+
+
+def ensure_reconcile_state(db):
+    """
+    Key/value state of the incremental build:
+    - last_parsed_log_id: highest parsed_logs.id already reconciled
+    - parsed_logs_version: parsed_logs version stamp at that point; a new
+      stamp means parsed_logs was recreated (ids start over), which forces a
+      rebuild
+    """
+    db.ensure_table("reconcile_state", {"key": "TEXT PRIMARY KEY", "value": "INTEGER"})
+
+
+def get_state(conn, key):
+    row = conn.execute("SELECT value FROM reconcile_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_state(conn, key, value):
+    conn.execute(
+        "INSERT INTO reconcile_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+
+def create_reconcile_table(conn, table_name):
+    conn.execute(
+        f"CREATE TABLE {table_name} ("
+        + ", ".join(f"{col} {dtype}" for col, dtype in RECONCILE_EVENTS_SCHEMA.items())
+        + ")"
+    )
+
+
+def rebuild_reconcile_events(db, parsed_version):
+    """
+    Blue/green rebuild: reconcile all of parsed_logs into the shadow table
+    RECONCILE_SHADOW_TABLE, then swap it in for reconcile_events (see
+    Database.swap_table). Readers keep the old generation until the swap
+    commits; the bulk INSERT runs on the shadow, outside that transaction.
+    user_ledger is rebuilt and chain breaks labelled in the swap
+    transaction, so both tables change together.
+    Returns the number of rows inserted.
+    """
+    columns = ", ".join(RECONCILE_EVENTS_SCHEMA)
+    with db.transaction() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {RECONCILE_SHADOW_TABLE}")
+        create_reconcile_table(conn, RECONCILE_SHADOW_TABLE)
+        inserted = conn.execute(
+            f"INSERT INTO {RECONCILE_SHADOW_TABLE} ({columns}) {RECONCILE_QUERY}", (0,)
+        ).rowcount
+        # Rows parsed after this snapshot are picked up by the next run
+        watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM parsed_logs").fetchone()[0]
+        # Deletions up to here are covered by the full rebuild
+        conn.execute(f"DELETE FROM {STALE_FILES_TABLE}")
+
+    def finish(conn):
+        rebuild_user_ledger(conn)
+        ensure_reconcile_indexes(conn)
+        set_state(conn, 'last_parsed_log_id', watermark)
+        set_state(conn, 'parsed_logs_version', parsed_version)
+
+    db.swap_table('reconcile_events', RECONCILE_SHADOW_TABLE, finish)
+    return inserted
+
+
+def stage_stale_rows(conn):
+    """
+    Copy the reconcile_events rows of stale files (STALE_FILES_TABLE) into
+    STALE_ROWS_TABLE: one lookup on the filename index per stale file, done
+    once per run. Returns the first day among them, or None.
+    """
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {STALE_ROWS_TABLE} (parsed_log_id INTEGER, user_id TEXT, timestamp TEXT)")
+    conn.execute(f"DELETE FROM {STALE_ROWS_TABLE}")
+    conn.execute(f"""
+        INSERT INTO {STALE_ROWS_TABLE}
+        SELECT parsed_log_id, user_id, timestamp FROM reconcile_events
+        WHERE filename IN (SELECT filename FROM {STALE_FILES_TABLE})
+    """)
+    return conn.execute(f"SELECT MIN(timestamp) FROM {STALE_ROWS_TABLE}").fetchone()[0]
+
+
+def update_reconcile_events(db):
+    """
+    Incremental update, in one transaction:
+
+    - Rows of stale files (re-parsed or removed since the last run) are
+      deleted, and whatever parsed_logs rows those files still have are
+      reconciled again along with the rows above the stored id watermark
+    - user_ledger is updated, relabelling chain breaks from each affected
+      user's first changed day
+    The work follows the stale files and new rows, not the table size.
+    Returns (inserted, deleted, first day touched or None, the snapshot
+    partitions of the rows deleted, inserted or relabelled).
+    """
+    columns = ", ".join(RECONCILE_EVENTS_SCHEMA)
+    with db.transaction() as conn:
+        track_partitions(conn)
+        watermark = get_state(conn, 'last_parsed_log_id') or 0
+        since = stage_stale_rows(conn)
+        deleted = conn.execute(
+            f"DELETE FROM reconcile_events WHERE parsed_log_id IN (SELECT parsed_log_id FROM {STALE_ROWS_TABLE})"
+        ).rowcount
+
+        # Rows are appended, so this run's rows are the ones above it
+        last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM reconcile_events").fetchone()[0]
+        inserted = conn.execute(
+            f"INSERT INTO reconcile_events ({columns}) {RECONCILE_QUERY}", (watermark,)
+        ).rowcount
+        conn.execute(f"DELETE FROM {STALE_FILES_TABLE}")
+        if inserted:
+            first_new = conn.execute(
+                "SELECT MIN(timestamp) FROM reconcile_events WHERE rowid > ?", (last_rowid,)
+            ).fetchone()[0]
+            since = min(filter(None, (since, first_new)))
+        # Relabelled rows are on or after the first day touched above
+        update_user_ledger(conn, STALE_ROWS_TABLE, last_rowid)
+
+        set_state(conn, 'last_parsed_log_id',
+                  conn.execute("SELECT COALESCE(MAX(id), 0) FROM parsed_logs").fetchone()[0])
+        if inserted or deleted:
+            conn.execute("ANALYZE reconcile_events")
+        partitions = touched_partitions(conn)
+    return inserted, deleted, since, partitions
+
+
+@instrumented()
+def populate_reconcile_events(full=False):
+    """
+    Reconcile parsed_logs rows added since the last run into reconcile_events.
+
+    - New rows are parsed_logs rows above the stored id watermark; ids are
+      AUTOINCREMENT, so re-parsed files come back as new rows
+    - Rows of files whose parsed_logs rows were deleted since (recorded in
+      STALE_FILES_TABLE by a trigger) are deleted and reconciled again
+    - Rows are written with INSERT ... SELECT inside SQLite, all in one
+      transaction, so readers see either the previous or the new table
+    - user_ledger orders each user's rows and flags those whose old balance
+      isn't the previous new balance, labelled CHAIN BREAK (user_ledger.py)
+    - full=True, a recreated parsed_logs or a reconcile_events or
+      user_ledger in an older shape rebuilds the table into a shadow table
+      that is swapped in atomically (rebuild_reconcile_events)
+    - The daily rollup is refreshed from the earliest day touched
+    - A columnar snapshot for the dashboard is written when pyarrow is
+      installed, after an incremental update only its partitions with
+      changed rows (see reconcile_snapshot.py)
     """
+    with Database() as db:
+        ensure_reconcile_state(db)
+        # Deletions made before the stale-file log existed weren't recorded
+        tracked = bool(db.get_table_schema(STALE_FILES_TABLE))
+        ensure_stale_files(db)
+        parsed_version = db.get_table_version('parsed_logs')
+        rebuild = (
+            full
+            or not tracked
+            or db.get_table_schema('reconcile_events') != RECONCILE_EVENTS_SCHEMA
+            or db.get_table_schema(LEDGER_TABLE) != USER_LEDGER_SCHEMA
+            or get_state(db.connection, 'parsed_logs_version') != parsed_version
+        )
 
-    # Execute reconciliation query
-    reconcile_df = db.execute_query(query)
+        if rebuild:
+            inserted = rebuild_reconcile_events(db, parsed_version)
+            deleted = 0
+            since = ""
+            partitions = None
+            print(f"Rebuilt reconcile_events: {inserted} rows swapped in.")
+        else:
+            inserted, deleted, since, partitions = update_reconcile_events(db)
+            print(f"Updated reconcile_events: {inserted} rows inserted, {deleted} stale rows deleted.")
+            if not (inserted or deleted):
+                return
 
-    # Drop old reconcile_events table and insert fresh data
-    db.drop_table(table_name='reconcile_events')
-    db.insert_dataframe(table_name='reconcile_events', dataframe=reconcile_df)
-    db.close_connection()
+        refresh_daily_rollup(db, since=since)
+        previous = db.get_table_version('reconcile_events')
+        # Dashboard caches reload reconcile_events when this stamp changes
+        version = db.bump_table_version('reconcile_events')
+        write_reconcile_snapshot(db, version, previous, partitions)
 
 
 if __name__ == "__main__":
-    populate_reconcile_events()
+    parser = argparse.ArgumentParser(description="Reconcile parsed_logs into reconcile_events.")
+    parser.add_argument("--full", action="store_true",
+                        help="rebuild reconcile_events from all of parsed_logs instead of only new rows")
+    args = parser.parse_args()
+    populate_reconcile_events(full=args.full)
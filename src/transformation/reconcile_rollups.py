@@ -0,0 +1,123 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.db_manager import Database
+from src.monitoring.metrics import instrumented
+
+DAILY_ROLLUP_TABLE = "reconcile_daily_rollup"
+
+# One row per (date, country, mismatch_type). cum_* columns are running totals
+# of the series (country, mismatch_type) over all dates up to and including
+# `date`.
+DAILY_ROLLUP_SCHEMA = {
+    "date": "TEXT",                     # YYYY-MM-DD
+    "country": "TEXT",
+    "mismatch_type": "TEXT",
+    "event_count": "INTEGER",
+    "new_balance_sum": "REAL",
+    "expected_new_balance_sum": "REAL",
+    "cum_event_count": "INTEGER",
+    "cum_new_balance": "REAL",
+    "cum_expected_new_balance": "REAL"
+}
+
+# Daily aggregates of reconcile_events from a given date on
+DAILY_AGGREGATE_SQL = """
+    SELECT
+        timestamp AS date,
+        country,
+        mismatch_type,
+        COUNT(*) AS event_count,
+        TOTAL(new_balance) AS new_balance_sum,
+        TOTAL(expected_new_balance) AS expected_new_balance_sum
+    FROM reconcile_events
+    WHERE timestamp >= ?
+    GROUP BY timestamp, country, mismatch_type
+"""
+
+
+def ensure_daily_rollup(db):
+    db.ensure_table(DAILY_ROLLUP_TABLE, DAILY_ROLLUP_SCHEMA)
+    db.execute_write(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_{DAILY_ROLLUP_TABLE}_key
+        ON {DAILY_ROLLUP_TABLE} (country, mismatch_type, date)
+    """)
+
+
+def first_changed_date(db):
+    """
+    Earliest date whose daily aggregates in reconcile_events differ from the
+    stored rollup (new, changed or removed days), or None if it is current.
+    Sums are compared rounded so summation order can't flag a day.
+    """
+    query = f"""
+        WITH fresh AS (
+            SELECT date, country, mismatch_type, event_count,
+                   ROUND(new_balance_sum, 6) AS new_balance_sum,
+                   ROUND(expected_new_balance_sum, 6) AS expected_new_balance_sum
+            FROM ({DAILY_AGGREGATE_SQL})
+        ),
+        stored AS (
+            SELECT date, country, mismatch_type, event_count,
+                   ROUND(new_balance_sum, 6), ROUND(expected_new_balance_sum, 6)
+            FROM {DAILY_ROLLUP_TABLE}
+        ),
+        changed AS (
+            SELECT * FROM (SELECT * FROM fresh EXCEPT SELECT * FROM stored)
+            UNION ALL
+            SELECT * FROM (SELECT * FROM stored EXCEPT SELECT * FROM fresh)
+        )
+        SELECT MIN(date) AS since FROM changed
+    """
+    return db.execute_query(query, ("",))["since"].iloc[0]
+
+
+@instrumented()
+def refresh_daily_rollup(db, since=None):
+    """
+    Bring reconcile_daily_rollup up to date with reconcile_events.
+
+    Only days from `since` (YYYY-MM-DD) onwards are rewritten; by default
+    that is the first changed day, so a run that only adds new days touches
+    only those. Cumulative columns continue from the last stored day before
+    `since` in each series. Returns the date refreshed from, or None when
+    nothing changed.
+    """
+    ensure_daily_rollup(db)
+    if since is None:
+        since = first_changed_date(db)
+        if since is None:
+            print(f"{DAILY_ROLLUP_TABLE} is up to date.")
+            return None
+
+    def carried(column):
+        # Running total of the series before `since`
+        return f"""COALESCE((
+            SELECT r.{column} FROM {DAILY_ROLLUP_TABLE} r
+            WHERE r.country IS d.country AND r.mismatch_type IS d.mismatch_type AND r.date < ?
+            ORDER BY r.date DESC LIMIT 1
+        ), 0)"""
+
+    series = "PARTITION BY d.country, d.mismatch_type ORDER BY d.date"
+    with db.connection:
+        db.connection.execute(f"DELETE FROM {DAILY_ROLLUP_TABLE} WHERE date >= ?", (since,))
+        db.connection.execute(f"""
+            INSERT INTO {DAILY_ROLLUP_TABLE} ({', '.join(DAILY_ROLLUP_SCHEMA)})
+            SELECT
+                d.date, d.country, d.mismatch_type,
+                d.event_count, d.new_balance_sum, d.expected_new_balance_sum,
+                {carried('cum_event_count')} + SUM(d.event_count) OVER ({series}),
+                {carried('cum_new_balance')} + SUM(d.new_balance_sum) OVER ({series}),
+                {carried('cum_expected_new_balance')} + SUM(d.expected_new_balance_sum) OVER ({series})
+            FROM ({DAILY_AGGREGATE_SQL}) d
+        """, (since, since, since, since))
+
+    rows = db.execute_query(f"SELECT COUNT(*) AS n FROM {DAILY_ROLLUP_TABLE} WHERE date >= ?", (since,))["n"].iloc[0]
+    print(f"Refreshed {DAILY_ROLLUP_TABLE} from {since or 'the first day'}: {rows} rows.")
+    return since
+
+
+if __name__ == "__main__":
+    with Database() as db:
+        refresh_daily_rollup(db)
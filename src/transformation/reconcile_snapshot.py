@@ -0,0 +1,280 @@
+import os
+import sys
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.monitoring.metrics import instrumented
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # optional: without pyarrow no snapshot is written and the dashboard reads SQLite
+    pa = None
+
+# Columnar copy of reconcile_events for fast dashboard loads. SQLite stays the
+# system of record: a snapshot is only read while its version matches the
+# reconcile_events version stamp. Defaults to a folder next to the database.
+RECONCILE_SNAPSHOT_DIR = os.getenv("RECONCILE_SNAPSHOT_DIR", "")
+
+# "ipc" (Arrow IPC files, memory-mapped on read) or "parquet"
+RECONCILE_SNAPSHOT_FORMAT = os.getenv("RECONCILE_SNAPSHOT_FORMAT", "ipc")
+
+# Hive-style partitions, e.g. month=2024-03/country=Bahrain. reconcile_events
+# timestamps are days, and a partition per day and country would hold a
+# handful of rows, so dates are partitioned by month; the exact day range is
+# a row filter within the selected months.
+PARTITION_COLUMNS = ("month", "country")
+
+# reconcile_events rows fetched per record batch while writing
+SNAPSHOT_BATCH_ROWS = 50_000
+
+# Pointer to the current snapshot: the reconcile_events version it was
+# written at. Each version is a dataset folder of its own (version_folder)
+# next to it, and a new one is published by replacing this file, so a
+# reader always opens a complete snapshot.
+VERSION_FILE = "_version"
+
+# Snapshot versions kept: the current one and the one before, so a reader
+# that read the pointer just before a switch can still open its files
+SNAPSHOT_KEEP_VERSIONS = 2
+
+ARROW_TYPES = {"TEXT": "string", "REAL": "float64", "INTEGER": "int64"}
+
+# Temp table the tracking triggers (track_partitions) fill with the
+# (month, country) of every reconcile_events row written on a connection
+TOUCHED_PARTITIONS_TABLE = "snapshot_touched_partitions"
+
+
+def snapshot_dir(db_name):
+    return RECONCILE_SNAPSHOT_DIR or os.path.join(
+        os.path.dirname(os.path.abspath(db_name)), "reconcile_events_snapshot"
+    )
+
+
+def version_folder(path, version):
+    return os.path.join(path, f"v{version}")
+
+
+def snapshot_version(path):
+    """reconcile_events version of the current snapshot under path, or None."""
+    try:
+        with open(os.path.join(path, VERSION_FILE)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]), flavor="hive")
+
+
+def arrow_schema(table_schema):
+    """Arrow schema for a {column: SQLite type} table schema (see Database.get_table_schema)."""
+    return pa.schema([
+        pa.field(col, getattr(pa, ARROW_TYPES.get(dtype, "string"))())
+        for col, dtype in table_schema.items()
+    ])
+
+
+def to_record_batch(rows, schema):
+    """Record batch of SQLite row tuples, in schema column order."""
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+        schema=schema
+    )
+
+
+def track_partitions(conn):
+    """
+    Start recording the partitions (month, country) of the reconcile_events
+    rows this connection inserts, deletes or updates, with temp triggers
+    no other connection sees. Read them back with touched_partitions.
+    """
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {TOUCHED_PARTITIONS_TABLE} (month TEXT, country TEXT)")
+    for event, rows in (("INSERT", ("NEW",)), ("DELETE", ("OLD",)), ("UPDATE", ("OLD", "NEW"))):
+        inserts = " ".join(
+            f"INSERT INTO {TOUCHED_PARTITIONS_TABLE} VALUES (substr({row}.timestamp, 1, 7), {row}.country);"
+            for row in rows
+        )
+        conn.execute(f"""
+            CREATE TEMP TRIGGER IF NOT EXISTS {TOUCHED_PARTITIONS_TABLE}_{event.lower()}
+            AFTER {event} ON main.reconcile_events
+            BEGIN {inserts} END
+        """)
+
+
+def touched_partitions(conn):
+    """Stop track_partitions and return the set of (month, country) it recorded."""
+    partitions = set(conn.execute(f"SELECT DISTINCT month, country FROM temp.{TOUCHED_PARTITIONS_TABLE}"))
+    for event in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS temp.{TOUCHED_PARTITIONS_TABLE}_{event}")
+    conn.execute(f"DROP TABLE IF EXISTS temp.{TOUCHED_PARTITIONS_TABLE}")
+    return partitions
+
+
+def _partition_where(partitions):
+    """WHERE clause and parameters selecting the rows of the given (month, country) partitions."""
+    terms = " OR ".join(["(substr(timestamp, 1, 7) IS ? AND country IS ?)"] * len(partitions))
+    params = [value for partition in sorted(partitions, key=repr) for value in partition]
+    months = [month for month, _ in partitions]
+    if None in months:
+        return f"WHERE {terms}", params
+    # Lets the timestamp index skip the months before the first one touched
+    return f"WHERE timestamp >= ? AND ({terms})", [min(months)] + params
+
+
+def _iter_batches(db, schema, partitions=None):
+    """
+    reconcile_events as record batches, in rowid order, with the month
+    partition key; only the rows of `partitions` when given.
+    """
+    columns = [name for name in schema.names if name != "month"]
+    where, params = _partition_where(partitions) if partitions is not None else ("", [])
+    cursor = db.connection.execute(
+        f"SELECT {', '.join(columns)}, substr(timestamp, 1, 7) AS month FROM reconcile_events {where} ORDER BY rowid",
+        params
+    )
+    while True:
+        rows = cursor.fetchmany(SNAPSHOT_BATCH_ROWS)
+        if not rows:
+            break
+        yield to_record_batch(rows, schema)
+
+
+def _link_partitions(source, target, extension, skip):
+    """
+    Hard-link (or copy, where links aren't supported) the files of the
+    partitions of the dataset folder `source` that aren't in `skip` into
+    the same partition folders under `target`. Returns how many partitions,
+    or None if source has files of another format.
+    """
+    if any(not name.endswith(f".{extension}") for _, _, names in os.walk(source) for name in names):
+        return None
+    dataset = ds.dataset(source, format=RECONCILE_SNAPSHOT_FORMAT, partitioning=_partitioning())
+    linked = set()
+    for fragment in dataset.get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        partition = tuple(keys.get(column) for column in PARTITION_COLUMNS)
+        if partition in skip:
+            continue
+        destination = os.path.join(target, os.path.relpath(fragment.path, source))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(fragment.path, destination)
+        except OSError:
+            shutil.copy2(fragment.path, destination)
+        linked.add(partition)
+    return len(linked)
+
+
+@instrumented()
+def write_reconcile_snapshot(db, version, previous=None, partitions=None):
+    """
+    Write reconcile_events as a columnar dataset partitioned by month and
+    country (see PARTITION_COLUMNS), stamped with `version`.
+
+    - Built in a staging folder, renamed to its version folder, then
+      published by replacing the VERSION_FILE pointer; the previous
+      version's folder stays in place (SNAPSHOT_KEEP_VERSIONS), so a reader
+      never sees a half-written snapshot or loses the one it is reading
+    - partitions, the (month, country) partitions whose rows changed since
+      version `previous` (see track_partitions): when the current snapshot
+      is that version, only those are rewritten and the others are
+      hard-linked from it, so a run costs what it changed, not the table.
+      Otherwise every partition is written
+    - Rows are streamed from SQLite in record batches
+    - Without pyarrow this does nothing
+    Returns the snapshot folder, or None if none was written.
+    """
+    if pa is None:
+        return None
+    root = snapshot_dir(db.db_name)
+    target = version_folder(root, version)
+    staging = os.path.join(root, f".tmp-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    schema = arrow_schema(db.get_table_schema("reconcile_events")).append(pa.field("month", pa.string()))
+    extension = "parquet" if RECONCILE_SNAPSHOT_FORMAT == "parquet" else "arrow"
+    os.makedirs(staging)
+    linked = None
+    if partitions is not None and previous is not None and snapshot_version(root) == previous:
+        linked = _link_partitions(version_folder(root, previous), staging, extension, partitions)
+        if linked is None:
+            # Written in the other format; start over with every partition
+            shutil.rmtree(staging)
+            os.makedirs(staging)
+    # write_dataset would pull an iterator from its own threads, and the
+    # SQLite connection belongs to this one, so batches are written one call
+    # at a time, each under its own file names (versioned, so they never
+    # collide with linked files)
+    batches = _iter_batches(db, schema, partitions if linked is not None else None)
+    for n, batch in enumerate(batches):
+        ds.write_dataset(
+            batch,
+            staging,
+            format=RECONCILE_SNAPSHOT_FORMAT,
+            partitioning=_partitioning(),
+            basename_template=f"part-v{version}-{n}-{{i}}.{extension}",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+    # Versions only move forward, so an existing folder is a leftover of a
+    # run that failed before publishing it
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(staging, target)
+    pointer = os.path.join(root, VERSION_FILE)
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(str(version))
+    os.replace(f"{pointer}.tmp", pointer)
+    _prune_versions(root, version)
+    if linked is None:
+        print(f"Wrote reconcile_events snapshot (version {version}) to {target}.")
+    else:
+        print(f"Wrote reconcile_events snapshot (version {version}) to {target}: "
+              f"{len(partitions)} partitions rewritten, {linked} linked from version {previous}.")
+    return target
+
+
+def _prune_versions(root, version):
+    """Remove version folders older than the last SNAPSHOT_KEEP_VERSIONS (and any older layout)."""
+    keep = {f"v{version - n}" for n in range(SNAPSHOT_KEEP_VERSIONS)}
+    for entry in os.scandir(root):
+        # Staging folders (.tmp-*) belong to writers still running
+        if entry.is_dir() and entry.name not in keep and not entry.name.startswith("."):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def read_reconcile_snapshot(db, version):
+    """
+    reconcile_events rows from the snapshot, or None if there is no snapshot
+    at `version` (or no pyarrow), in which case read SQLite instead.
+
+    Arrow IPC files are memory-mapped, so column data is read from the page
+    cache without per-row Python objects. Rows come back in reconcile_events
+    order (by parsed_log_id).
+    """
+    if pa is None:
+        return None
+    root = snapshot_dir(db.db_name)
+    if snapshot_version(root) != version:
+        return None
+
+    # The partition keys come last in the dataset schema
+    columns = list(db.get_table_schema("reconcile_events"))
+    try:
+        dataset = ds.dataset(
+            version_folder(root, version),
+            format=RECONCILE_SNAPSHOT_FORMAT,
+            partitioning=_partitioning(),
+            filesystem=pafs.LocalFileSystem(use_mmap=True),
+        )
+        if not dataset.files:
+            # An empty table leaves no files to take the column types from
+            return None
+        table = dataset.to_table(columns=columns)
+    except (OSError, pa.ArrowException):
+        # Pruned by writers that published two newer versions meanwhile
+        return None
+    # Partitions are read folder by folder; restore the table's order
+    return table.to_pandas().sort_values("parsed_log_id", kind="stable", ignore_index=True)
@@ -0,0 +1,176 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.reconcile_queries import NO_ISSUE, CHAIN_BREAK
+
+LEDGER_TABLE = "user_ledger"
+
+# One entry per reconcile_events row with a user, in each user's transaction
+# order. prev_* describe the user's previous entry (NULL for the first one).
+USER_LEDGER_SCHEMA = {
+    "user_id": "TEXT",
+    "timestamp": "TEXT",
+    "filename": "TEXT",
+    "parsed_log_id": "INTEGER",         # reconcile_events.parsed_log_id of the entry
+    "old_balance": "REAL",
+    "new_balance": "REAL",
+    "prev_new_balance": "REAL",
+    "prev_parsed_log_id": "INTEGER",
+    "balance_gap": "REAL",              # old_balance - prev_new_balance
+    "is_chain_break": "INTEGER"
+}
+
+LEDGER_INDEXES = {
+    # The ledger order itself: the chain window reads each user's entries
+    # straight from it, without sorting
+    "idx_user_ledger_user_id_timestamp": ("user_id", "timestamp", "filename", "parsed_log_id"),
+    "idx_user_ledger_parsed_log_id": ("parsed_log_id",),
+}
+
+# Transaction order of a user. Timestamps are days; within a day entries are
+# ordered by log stream, then by parsed_logs id, i.e. the order of the lines
+# in the stream, so the order doesn't depend on the order files were loaded.
+CHAIN_WINDOW = "PARTITION BY user_id ORDER BY timestamp, filename, parsed_log_id"
+
+# An entry whose old balance isn't where the previous transaction left the
+# balance, with the same tolerance as CALCULATION ISSUE
+CHAIN_BREAK_SQL = "prev_new_balance IS NOT NULL AND ROUND(old_balance - prev_new_balance, 0) != 0"
+
+# reconcile_events columns an entry is built from
+ENTRY_COLUMNS = "user_id, timestamp, filename, parsed_log_id, old_balance, new_balance"
+
+# The previous entry, over WINDOW chain, then the chain columns derived from it
+LAG_COLUMNS = """
+    LAG(new_balance) OVER chain AS prev_new_balance,
+    LAG(parsed_log_id) OVER chain AS prev_parsed_log_id
+"""
+CHAIN_COLUMNS = f"""
+    prev_new_balance,
+    prev_parsed_log_id,
+    old_balance - prev_new_balance AS balance_gap,
+    {CHAIN_BREAK_SQL} AS is_chain_break
+"""
+
+
+def create_user_ledger(conn):
+    conn.execute(
+        f"CREATE TABLE {LEDGER_TABLE} ("
+        + ", ".join(f"{col} {dtype}" for col, dtype in USER_LEDGER_SCHEMA.items())
+        + ")"
+    )
+
+
+def ensure_ledger_indexes(conn):
+    for name, columns in LEDGER_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {LEDGER_TABLE} ({', '.join(columns)})")
+
+
+def label_chain_breaks(conn, entries=f"{LEDGER_TABLE} l"):
+    """
+    Align reconcile_events.mismatch_type with the ledger for the entries
+    `entries` yields as `l` (a FROM clause, default the whole ledger): rows
+    with no row-level issue become CHAIN BREAK where their entry is a break,
+    and CHAIN BREAK rows whose chain is whole again go back to no issue.
+    Row-level issues take precedence and are never relabelled.
+    Returns the number of rows relabelled.
+    """
+    relabelled = 0
+    for is_break, old_type, new_type in ((1, NO_ISSUE, CHAIN_BREAK), (0, CHAIN_BREAK, NO_ISSUE)):
+        relabelled += conn.execute(f"""
+            UPDATE reconcile_events SET mismatch_type = ?
+            WHERE mismatch_type = ? AND parsed_log_id IN (
+                SELECT l.parsed_log_id FROM {entries} WHERE l.is_chain_break = ?
+            )
+        """, (new_type, old_type, is_break)).rowcount
+    return relabelled
+
+
+def rebuild_user_ledger(conn):
+    """
+    Build user_ledger from all of reconcile_events in a single windowed pass
+    (LAG over each user's entries), then label the chain breaks. Runs on
+    the caller's transaction, e.g. the one that swaps in a rebuilt
+    reconcile_events, so the two never disagree.
+    Returns the number of chain breaks.
+    """
+    conn.execute(f"DROP TABLE IF EXISTS {LEDGER_TABLE}")
+    create_user_ledger(conn)
+    conn.execute(f"""
+        INSERT INTO {LEDGER_TABLE} ({', '.join(USER_LEDGER_SCHEMA)})
+        SELECT {ENTRY_COLUMNS}, {CHAIN_COLUMNS}
+        FROM (
+            SELECT {ENTRY_COLUMNS}, {LAG_COLUMNS}
+            FROM reconcile_events
+            WHERE user_id IS NOT NULL
+            WINDOW chain AS ({CHAIN_WINDOW})
+        )
+    """)
+    # Built once the table is loaded, as for reconcile_events
+    ensure_ledger_indexes(conn)
+    conn.execute(f"ANALYZE {LEDGER_TABLE}")
+    label_chain_breaks(conn)
+    return conn.execute(f"SELECT COUNT(*) FROM {LEDGER_TABLE} WHERE is_chain_break = 1").fetchone()[0]
+
+
+def update_user_ledger(conn, stale_table, last_rowid):
+    """
+    Incremental update after the reconcile_events rows listed in
+    stale_table (parsed_log_id, user_id, timestamp) were deleted and the
+    rows above rowid last_rowid were added:
+
+    - Stale entries are dropped and the new rows added
+    - The chain columns are recomputed in one windowed pass over the users
+      with a changed entry only, from their earliest changed day, so the
+      cost follows the size of the update rather than the number of users
+    - Their reconcile_events rows are relabelled (label_chain_breaks)
+    Returns the number of rows relabelled.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS ledger_touched (user_id TEXT PRIMARY KEY, since TEXT)")
+    conn.execute("DELETE FROM temp.ledger_touched")
+    conn.execute(f"""
+        INSERT INTO temp.ledger_touched (user_id, since)
+        SELECT user_id, MIN(timestamp) FROM (
+            SELECT user_id, timestamp FROM {stale_table}
+            UNION ALL
+            SELECT user_id, timestamp FROM reconcile_events WHERE rowid > ?
+        )
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    """, (last_rowid,))
+
+    conn.execute(f"DELETE FROM {LEDGER_TABLE} WHERE parsed_log_id IN (SELECT parsed_log_id FROM {stale_table})")
+    conn.execute(f"""
+        INSERT INTO {LEDGER_TABLE} ({ENTRY_COLUMNS})
+        SELECT {ENTRY_COLUMNS} FROM reconcile_events
+        WHERE rowid > ? AND user_id IS NOT NULL
+    """, (last_rowid,))
+
+    # Only entries from a user's first changed day on can have a new
+    # predecessor, but the window starts at the user's first entry so LAG
+    # sees the one before that day
+    conn.execute(f"""
+        UPDATE {LEDGER_TABLE} SET
+            prev_new_balance = chain.prev_new_balance,
+            prev_parsed_log_id = chain.prev_parsed_log_id,
+            balance_gap = chain.balance_gap,
+            is_chain_break = chain.is_chain_break
+        FROM (
+            SELECT entry, user_id, timestamp, {CHAIN_COLUMNS}
+            FROM (
+                SELECT rowid AS entry, {ENTRY_COLUMNS}, {LAG_COLUMNS}
+                FROM {LEDGER_TABLE}
+                WHERE user_id IN (SELECT user_id FROM temp.ledger_touched)
+                WINDOW chain AS ({CHAIN_WINDOW})
+            )
+        ) chain
+        JOIN temp.ledger_touched t ON t.user_id = chain.user_id
+        WHERE {LEDGER_TABLE}.rowid = chain.entry AND chain.timestamp >= t.since
+    """)
+
+    # CROSS JOIN keeps SQLite from scanning the ledger for the (unanalyzed)
+    # temp table: each touched user is a range of the ledger index
+    return label_chain_breaks(
+        conn,
+        f"temp.ledger_touched t CROSS JOIN {LEDGER_TABLE} l ON l.user_id = t.user_id AND l.timestamp >= t.since"
+    )
@@ -1,44 +1,42 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.storage.db_manager import Database
+from src.storage.reconcile_queries import (
+    TABLE_COLUMNS,
+    query_reconcile_events,
+    count_reconcile_events,
+    distinct_values,
+    summarize_reconcile_events,
+    build_order_by,
+    running_totals,
+)
+from src.visualization.data_access import get_reconcile_events_where
+from src.visualization.export import export_url
+from src.monitoring.metrics import instrumented
 import pandas as pd
 from dash import Output, Input, State, no_update, callback, Dash, dcc, html, dash_table
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 
 
-def prepare_anomaly_data():
-    """Prepare anomaly data by calculating mismatch flags and amounts."""
-    df = get_data()
-    numeric_cols = ['amount', 'vat', 'old_balance', 'new_balance', 'paymentBalance', 'subscriptionBalance']
-    df[numeric_cols] = df[numeric_cols].astype(float)
-    df['is_mismatch'] = (df['mismatch_type'] != 'NO FOUND ISSUE').astype(int)
-    df['mismatch_amount'] = df['new_balance'] - df['expected_new_balance']
-    df = df[df['mismatch_amount'].round(0) != 0]
-    df = df[df['is_mismatch'] == 1]
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    return df
-
-
-def prepare_data():
-    """Prepare main data with mismatch flag and cumulative calculations."""
-    df = get_data()
-    numeric_cols = ['amount', 'vat', 'old_balance', 'new_balance', 'paymentBalance', 'subscriptionBalance', 'expected_new_balance']
-    df[numeric_cols] = df[numeric_cols].astype(float)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['is_mismatch'] = (df['mismatch_type'] != 'NO FOUND ISSUE').astype(int)
-    df = df[df['is_mismatch'] == 1]
-    df['mismatch_amount'] = df['new_balance'] - df['expected_new_balance']
-    return df
-
-
-def get_data():
-    """Retrieve reconcile_events data from the database."""
-    db = Database()
-    db.connect()
-    reconcile_df = db.select_table('reconcile_events')
-    db.close_connection()
-    return reconcile_df
+# Columns the anomaly filter options are built from: is_anomaly needs the
+# mismatch type and both balances, parsed_log_id keeps the table's order
+ANOMALY_OPTION_COLUMNS = ['parsed_log_id', 'country', 'user_id', 'mismatch_type', 'timestamp', 'new_balance', 'expected_new_balance']
+
+
+def prepare_anomaly_data(countries=None, start_date=None, end_date=None, columns=None):
+    """
+    Anomalous rows (mismatches whose amount rounds to a non-zero value) of
+    the given countries and day range; see get_reconcile_events_where.
+    """
+    df = get_reconcile_events_where(countries, start_date, end_date, columns)
+    return df[df['is_anomaly']]
+
+
+def to_table_records(df):
+    """DataTable rows; float32 amounts go out as their 2-decimal values."""
+    amounts = df.select_dtypes('float32').columns
+    return df.astype({col: 'float64' for col in amounts}).round({col: 2 for col in amounts}).to_dict('records')
 
 
 def register_callbacks(app):
@@ -48,6 +46,7 @@ def register_callbacks(app):
         Output('country-warning', 'children'),
         Input('filter-country', 'value')
     )
+    @instrumented("callback.show_country_warning")
     def show_country_warning(selected_countries):
         if selected_countries and len(selected_countries) > 1:
             return "Warning: Selected countries have different currencies. Aggregation will be inaccurate."
@@ -58,8 +57,8 @@ def register_callbacks(app):
             Output("summary-total-users", "children"),
             Output("summary-total-mismatch", "children"),
             Output("summary-last-sync", "children"),
-            Output("reconciliation-table", "data"),
-            Output("store-filtered-data", "data")
+            Output("store-filtered-data", "data"),
+            Output("reconciliation-table", "page_current")
         ],
         Input("btn-apply-filters", "n_clicks"),
         State("filter-user-id", "value"),
@@ -70,62 +69,72 @@ def register_callbacks(app):
         State("filter-overdraft", "value"),
         prevent_initial_call=False
     )
+    @instrumented("callback.apply_filters")
     def apply_filters(n_clicks, selected_users, start_date, end_date, selected_country, selected_mismatch_types, is_over_draft):
-        reconcile_df = get_data()
-        reconcile_df['date'] = pd.to_datetime(reconcile_df['timestamp'])
-        reconcile_df['timestamp'] = pd.to_datetime(reconcile_df['timestamp']).dt.date
-
-        if selected_users:
-            reconcile_df = reconcile_df[reconcile_df['user_id'].isin(selected_users)]
-        if selected_country:
-            reconcile_df = reconcile_df[reconcile_df['country'].isin(selected_country)]
-        if selected_mismatch_types:
-            reconcile_df = reconcile_df[reconcile_df['mismatch_type'].isin(selected_mismatch_types)]
-        if is_over_draft:
-            reconcile_df = reconcile_df[reconcile_df['is_overdraft'].isin(is_over_draft)]
-
-        start = pd.to_datetime(start_date).date() if start_date else None
-        end = pd.to_datetime(end_date).date() if end_date else None
-        if start and end:
-            reconcile_df = reconcile_df[
-                (reconcile_df['date'].dt.date >= start) & (reconcile_df['date'].dt.date <= end)
-            ]
-
-        numeric_cols = ['new_balance', 'old_balance', 'amount', 'vat', 'paymentBalance', 'subscriptionBalance']
-        reconcile_df[numeric_cols] = reconcile_df[numeric_cols].astype(float)
-
-        count_users = (
-            reconcile_df[
-                (reconcile_df['mismatch_type'] != 'NO FOUND ISSUE') &
-                (reconcile_df['new_balance'] != (reconcile_df['old_balance'] + reconcile_df['amount'] - reconcile_df['vat']))
-            ]['user_id']
-            .nunique()
+        has_range = bool(start_date and end_date)
+        filters = dict(
+            user_ids=selected_users,
+            countries=selected_country,
+            mismatch_types=selected_mismatch_types,
+            overdraft=is_over_draft,
+            start_date=start_date if has_range else None,
+            end_date=end_date if has_range else None,
         )
+        with Database(read_only=True) as db:
+            summary = summarize_reconcile_events(db, **filters)
 
-        total_mismatch = (
-            (reconcile_df['new_balance'] - (reconcile_df['old_balance'] + reconcile_df['amount'] - reconcile_df['vat']))[
-                (reconcile_df['mismatch_type'] != 'NO FOUND ISSUE') &
-                (reconcile_df['new_balance'] != (reconcile_df['old_balance'] + reconcile_df['amount'] - reconcile_df['vat']))
-            ]
-            .sum()
-        )
+        formatted_total_mismatch = f"{summary['total_mismatch']:,.0f}"
+        last_sync = pd.to_datetime(summary['last_sync']) if summary['last_sync'] else pd.NaT
 
-        formatted_total_mismatch = f"{total_mismatch:,.0f}"
-        last_sync = reconcile_df[reconcile_df['mismatch_type'] != 'NO FOUND ISSUE']['date'].max()
+        # The store keeps the filter state, not the rows: the table fetches its
+        # current page from it and export re-runs the query. New filters
+        # start the table over at the first page.
+        return str(summary['users']), str(formatted_total_mismatch), str(last_sync), filters, 0
 
-        return str(count_users), str(formatted_total_mismatch), str(last_sync), reconcile_df.to_dict('records'), reconcile_df.to_dict('records')
+    @app.callback(
+        [
+            Output("reconciliation-table", "data"),
+            Output("reconciliation-table", "page_count")
+        ],
+        Input("store-filtered-data", "data"),
+        Input("reconciliation-table", "page_current"),
+        Input("reconciliation-table", "page_size"),
+        Input("reconciliation-table", "sort_by"),
+        Input("reconciliation-table", "filter_query")
+    )
+    @instrumented("callback.update_reconciliation_table")
+    def update_reconciliation_table(filters, page_current, page_size, sort_by, filter_query):
+        if filters is None:
+            # apply_filters hasn't stored the filter state yet
+            return no_update, no_update
+
+        page_current = page_current or 0
+        with Database(read_only=True) as db:
+            total = count_reconcile_events(db, filter_query=filter_query, **filters)
+            page_df = query_reconcile_events(
+                db,
+                columns=", ".join(TABLE_COLUMNS),
+                order_by=build_order_by(sort_by),
+                limit=page_size,
+                offset=page_current * page_size,
+                filter_query=filter_query,
+                **filters
+            )
+        page_count = max(1, -(-total // page_size))
+        return page_df.to_dict('records'), page_count
 
     @callback(
-        Output("download-transactions", "data"),
-        Input("btn-export", "n_clicks"),
-        State("store-filtered-data", "data"),
-        prevent_initial_call=True
+        Output("btn-export", "href"),
+        Input("store-filtered-data", "data"),
+        Input("export-format", "value")
     )
-    def export_transactions(n_clicks, filtered_data):
-        if not filtered_data:
+    @instrumented("callback.update_export_link")
+    def update_export_link(filters, export_format):
+        # The button links to the streaming export route (see export.py);
+        # the browser downloads from it directly
+        if filters is None:
             return no_update
-        csv_string = pd.DataFrame(filtered_data).to_csv(index=False)
-        return dict(content=csv_string, filename="transactions.csv")
+        return export_url(filters, export_format or "csv")
 
     @callback(
         [
@@ -140,26 +149,22 @@ def register_callbacks(app):
             Input('date-filter', 'end_date')
         ]
     )
+    @instrumented("callback.update_charts")
     def update_charts(country_filter, mismatch_filter, start_date, end_date):
-        df = prepare_data()
-        df = df.rename(columns={'transaction_id': 'id'})
-        df = df[df['mismatch_type'] != 'NO FOUND ISSUE']
-
-        df_users = df.copy()
-
-        if country_filter:
-            df = df[df['country'] == country_filter]
-        if mismatch_filter:
-            df = df[df['mismatch_type'].isin(mismatch_filter)]
-        if start_date and end_date:
-            df = df[(df['timestamp'] >= start_date) & (df['timestamp'] <= end_date)]
-
-        country_options = [{'label': c, 'value': c} for c in df_users['country'].dropna().unique()]
-        mismatch_options = [{'label': m, 'value': m} for m in df_users['mismatch_type'].dropna().unique()]
-
-        df_sorted = df.sort_values('timestamp')
-        df_sorted['cumulative_actual'] = df_sorted['new_balance'].cumsum()
-        df_sorted['cumulative_expected'] = df_sorted['expected_new_balance'].cumsum()
+        has_range = bool(start_date and end_date)
+        with Database(read_only=True) as db:
+            # A few hundred pre-aggregated daily points instead of every transaction
+            df_sorted = running_totals(
+                db,
+                countries=country_filter,
+                mismatch_types=mismatch_filter,
+                start_date=start_date if has_range else None,
+                end_date=end_date if has_range else None,
+                mismatches_only=True,
+            )
+            country_options = [{'label': c, 'value': c} for c in distinct_values(db, 'country', table='reconcile_daily_rollup', mismatches_only=True)]
+            mismatch_options = [{'label': m, 'value': m} for m in distinct_values(db, 'mismatch_type', table='reconcile_daily_rollup', mismatches_only=True)]
+        df_sorted['timestamp'] = pd.to_datetime(df_sorted['date'])
 
         fig_running = go.Figure()
         fig_running.add_trace(go.Scatter(x=df_sorted['timestamp'], y=df_sorted['cumulative_actual'], mode='lines', name='Actual'))
@@ -187,9 +192,11 @@ def register_callbacks(app):
             Input('top-n-dropdown', 'value')   
         ]
     )
+    @instrumented("callback.update_anomaly_charts")
     def update_anomaly_charts(country_filter, user_filter, mismatch_filter, start_date, end_date, top_n):
-        df_full = prepare_anomaly_data()
-        df_full['short_id'] = df_full['user_id'].str[:6] + "…"
+        # Options and default range span every anomaly, so only the columns
+        # they need are sliced; the rows shown are sliced by country and date
+        df_full = prepare_anomaly_data(columns=ANOMALY_OPTION_COLUMNS)
 
         country_options = [{'label': c, 'value': c} for c in df_full['country'].dropna().unique()]
         user_options = [{'label': u, 'value': u} for u in df_full['user_id'].dropna().unique()]
@@ -198,22 +205,20 @@ def register_callbacks(app):
         start_date_default = df_full['timestamp'].min()
         end_date_default = df_full['timestamp'].max()
 
-        df_filtered = df_full.copy()
-        if country_filter:
-            df_filtered = df_filtered[df_filtered['country'] == country_filter]
+        has_range = bool(start_date and end_date)
+        df_filtered = prepare_anomaly_data(
+            countries=country_filter,
+            start_date=start_date if has_range else None,
+            end_date=end_date if has_range else None,
+        )
         if mismatch_filter:
             df_filtered = df_filtered[df_filtered['mismatch_type'].isin(mismatch_filter)]
         if user_filter:
             df_filtered = df_filtered[df_filtered['user_id'] == user_filter]
-        if start_date and end_date:
-            df_filtered = df_filtered[
-                (df_filtered['timestamp'] >= start_date) & 
-                (df_filtered['timestamp'] <= end_date)
-            ]
 
         anomalies = df_filtered
 
-        pareto_data = anomalies.groupby('short_id').size().reset_index(name='count')
+        pareto_data = anomalies.groupby('short_id', observed=True).size().reset_index(name='count')
         pareto_data = pareto_data.head(top_n)
         pareto_data = pareto_data.sort_values('count', ascending=False).reset_index(drop=True)
         pareto_data['cum_percent'] = pareto_data['count'].cumsum() / pareto_data['count'].sum() * 100
@@ -232,6 +237,6 @@ def register_callbacks(app):
             template="plotly_white"
         )
 
-        table_data = anomalies.to_dict('records')
+        table_data = to_table_records(anomalies)
 
         return table_data, country_options, user_options, mismatch_options, start_date_default, end_date_default, fig
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import threading
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.db_manager import Database
+from src.monitoring.metrics import count
+from src.storage.reconcile_queries import NO_ROW_ISSUE, to_iso_date, _as_list
+from src.transformation.reconcile_snapshot import read_reconcile_snapshot
+
+# Seconds a cached table is served before its version stamp is re-checked.
+# The stamp lookup is cheap, this only keeps bursts of callbacks from each
+# opening a connection.
+CACHE_CHECK_INTERVAL = float(os.getenv("CACHE_CHECK_INTERVAL", "2"))
+
+# table name -> {"version", "checked_at", "df"}
+_cache = {}
+_lock = threading.Lock()
+
+
+# Compact dtypes of the cached reconcile_events frame
+CATEGORY_COLUMNS = ('user_id', 'country', 'mismatch_type', 'type', 'source', 'action')
+AMOUNT_COLUMNS = (
+    'old_balance', 'amount', 'vat', 'new_balance', 'expected_new_balance',
+    'paymentBalance', 'subscriptionBalance', 'mismatch_amount'
+)
+
+
+# Derived column -> the columns it is derived from (see with_derived_columns)
+DERIVED_FROM = {
+    'is_mismatch': {'mismatch_type'},
+    'mismatch_amount': {'new_balance', 'expected_new_balance'},
+    'is_anomaly': {'mismatch_type', 'new_balance', 'expected_new_balance'},
+    'short_id': {'user_id'},
+}
+
+
+def with_derived_columns(df):
+    """
+    Apply the dashboard's dtypes and derived columns to reconcile_events
+    rows, as far as the columns present allow, so callbacks only slice:
+    - is_mismatch: mismatch_type is a row-level issue (not in NO_ROW_ISSUE)
+    - mismatch_amount: new_balance - expected_new_balance
+    - is_anomaly: a mismatch whose amount rounds to a non-zero value
+    - short_id: first 6 characters of user_id, for chart labels
+    - categoricals for the text columns, float32 amounts, datetime64 timestamp
+    """
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+
+    # Derived in float64, before the amounts are downcast
+    if 'mismatch_type' in df.columns:
+        df['is_mismatch'] = (~df['mismatch_type'].isin(NO_ROW_ISSUE)).astype('int8')
+    if {'new_balance', 'expected_new_balance'} <= set(df.columns):
+        df['mismatch_amount'] = df['new_balance'] - df['expected_new_balance']
+    if {'is_mismatch', 'mismatch_amount'} <= set(df.columns):
+        df['is_anomaly'] = (df['is_mismatch'] == 1) & (df['mismatch_amount'].round(0) != 0)
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in AMOUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('float32')
+    if 'is_overdraft' in df.columns:
+        df['is_overdraft'] = df['is_overdraft'].astype('int8')
+
+    if 'user_id' in df.columns:
+        # One string slice per user instead of per row
+        users = df['user_id'].cat.categories
+        df['short_id'] = df['user_id'].map(dict(zip(users, users.str[:6] + "…"))).astype('category')
+    return df
+
+
+def _load_reconcile_events(db):
+    """
+    Read reconcile_events (from the columnar snapshot when it is current,
+    else from SQLite) with its dtypes and derived columns applied once at
+    load (see with_derived_columns).
+    """
+    df = read_reconcile_snapshot(db, db.get_table_version('reconcile_events'))
+    if df is None:
+        df = db.select_table('reconcile_events')
+    return with_derived_columns(df)
+
+
+LOADERS = {
+    'reconcile_events': _load_reconcile_events,
+}
+
+
+def get_table(table_name):
+    """
+    Return a cached DataFrame of table_name, reloaded only when the table's
+    version stamp (see Database.bump_table_version) has moved.
+
+    Each process (e.g. every gunicorn worker) keeps its own copy. The frame
+    is a shallow copy: callers may add or replace columns, but must not
+    modify values in place. Served and reloaded frames are counted as
+    table_cache.hit / table_cache.reload.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(table_name)
+        if entry is not None and now - entry["checked_at"] < CACHE_CHECK_INTERVAL:
+            count("table_cache.hit", table=table_name)
+            return entry["df"].copy(deep=False)
+
+        with Database(read_only=True) as db:
+            version = db.get_table_version(table_name)
+            if entry is None or entry["version"] != version:
+                entry = {"version": version, "df": LOADERS[table_name](db)}
+                count("table_cache.reload", table=table_name)
+            else:
+                count("table_cache.hit", table=table_name)
+        entry["checked_at"] = now
+        _cache[table_name] = entry
+        return entry["df"].copy(deep=False)
+
+
+def get_reconcile_events():
+    """Cached reconcile_events with compact dtypes and derived columns (see _load_reconcile_events)."""
+    return get_table('reconcile_events')
+
+
+def get_reconcile_events_where(countries=None, start_date=None, end_date=None, columns=None):
+    """
+    reconcile_events rows of `countries` between start_date and end_date
+    (any of them None for no limit), with `columns` (default all) and the
+    derived columns they allow (see with_derived_columns).
+
+    Sliced from the cached frame (get_reconcile_events), so the snapshot is
+    read and the columns derived once per table version, not per callback.
+    """
+    df = get_reconcile_events()
+    rows = pd.Series(True, index=df.index)
+    selected = _as_list(countries)
+    if selected:
+        rows &= df['country'].isin(selected)
+    start, end = to_iso_date(start_date), to_iso_date(end_date)
+    if start:
+        rows &= df['timestamp'] >= start
+    if end:
+        rows &= df['timestamp'] <= end
+
+    if columns is not None:
+        requested = set(columns)
+        columns = list(columns) + [
+            name for name, sources in DERIVED_FROM.items() if name not in requested and sources <= requested
+        ]
+    return df.loc[rows, columns if columns is not None else df.columns]
@@ -0,0 +1,192 @@
+import io
+import os
+import csv
+import sys
+import zlib
+from urllib.parse import urlencode
+from flask import Response, abort, request, stream_with_context
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.storage.db_manager import Database
+from src.storage.reconcile_queries import IN_FILTERS, build_where
+from src.transformation.reconcile_snapshot import arrow_schema, to_record_batch
+from src.monitoring.metrics import count
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for format=parquet
+    pq = None
+
+EXPORT_ROUTE = "/export/transactions"
+
+# reconcile_events columns left out of exports
+EXPORT_EXCLUDED_COLUMNS = ("parsed_log_id",)
+
+# reconcile_events rows fetched from SQLite and sent per chunk
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# format query parameter -> (label, mimetype, download file name)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "text/csv", "transactions.csv"),
+    "csv.gz": ("CSV (gzip)", "application/gzip", "transactions.csv.gz"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet", "transactions.parquet"),
+}
+
+
+def export_format_options():
+    """Dropdown options of the formats this server can produce."""
+    return [
+        {'label': label, 'value': value}
+        for value, (label, _, _) in EXPORT_FORMATS.items()
+        if value != "parquet" or pq is not None
+    ]
+
+
+def export_url(filters, export_format="csv"):
+    """
+    Export link for the filter state apply_filters keeps in
+    store-filtered-data; list filters become repeated parameters.
+    """
+    params = {key: value for key, value in (filters or {}).items() if value not in (None, "", [])}
+    params["format"] = export_format
+    return f"{EXPORT_ROUTE}?{urlencode(params, doseq=True)}"
+
+
+def filters_from_args(args):
+    """build_where filters from the export_url query parameters."""
+    filters = {name: args.getlist(name) or None for name, _ in IN_FILTERS}
+    if filters["overdraft"]:
+        filters["overdraft"] = [int(value) for value in filters["overdraft"]]
+    filters["start_date"] = args.get("start_date") or None
+    filters["end_date"] = args.get("end_date") or None
+    return filters
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that buffers what the Parquet writer emits until drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_export_rows(filters, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield the {column: type} schema of the exported columns (every
+    reconcile_events column but EXPORT_EXCLUDED_COLUMNS, in table order),
+    then lists of up to chunk_rows row tuples matching filters, in table
+    order. The read connection is held until the generator finishes or is
+    closed (e.g. the client went away).
+    """
+    where, params = build_where(**filters)
+    with Database(read_only=True) as db:
+        schema = {
+            column: dtype for column, dtype in db.get_table_schema("reconcile_events").items()
+            if column not in EXPORT_EXCLUDED_COLUMNS
+        }
+        cursor = db.connection.execute(
+            f"SELECT {', '.join(schema)} FROM reconcile_events {where} ORDER BY rowid", params
+        )
+        yield schema
+        exported = 0
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            exported += len(rows)
+            yield rows
+        count("export.rows", exported)
+
+
+def iter_csv(filters):
+    rows = iter_export_rows(filters)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(next(rows))
+    for chunk in rows:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_parquet(filters):
+    """One Parquet row group per chunk, sent as soon as it is written."""
+    rows = iter_export_rows(filters)
+    schema = arrow_schema(next(rows))
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in rows:
+            writer.write_batch(to_record_batch(chunk, schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def register_export_route(server):
+    """
+    Add the transactions export to the Flask server behind the Dash app.
+
+    GET EXPORT_ROUTE streams the reconcile_events rows matching the
+    apply_filters filters (see export_url) straight from SQLite, a chunk
+    at a time, so the export never sits whole in memory or in the
+    browser. format is csv (default), csv.gz or parquet (needs pyarrow).
+    """
+
+    @server.route(EXPORT_ROUTE)
+    def export_transactions():
+        export_format = request.args.get("format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            abort(400, f"Unknown export format: {export_format}")
+        if export_format == "parquet" and pq is None:
+            abort(501, "Parquet export needs the pyarrow package")
+        try:
+            filters = filters_from_args(request.args)
+            build_where(**filters)
+        except ValueError as e:
+            abort(400, f"Invalid export filters: {e}")
+
+        if export_format == "parquet":
+            body = iter_parquet(filters)
+        elif export_format == "csv.gz":
+            body = iter_gzip(iter_csv(filters))
+        else:
+            body = iter_csv(filters)
+
+        _, mimetype, filename = EXPORT_FORMATS[export_format]
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
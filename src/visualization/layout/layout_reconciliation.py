@@ -3,36 +3,27 @@ import dash_bootstrap_components as dbc
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.storage.db_manager import Database
-import pandas as pd
+from src.storage.reconcile_queries import distinct_values, date_bounds
+from src.visualization.export import export_format_options
 from dash import Output, Input
 
-def get_reconcile_filters(df):
+def get_reconcile_filters(db):
     """
     Fetch distinct filter values from the reconcile table.
     """
     # Distinct currencies
-    countries = sorted(df['country'].dropna().unique().tolist())
-    mismatch_type = sorted(df['mismatch_type'].dropna().unique().tolist())
+    countries = distinct_values(db, 'country')
+    mismatch_type = distinct_values(db, 'mismatch_type')
 
-    user_ids = sorted(df['user_id'].dropna().unique().tolist())
+    user_ids = distinct_values(db, 'user_id')
 
-    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-    min_date = df['timestamp'].min()
-    max_date = df['timestamp'].max()
+    min_date, max_date = date_bounds(db)
 
     return countries, user_ids, min_date, max_date, mismatch_type
 
-def get_data():
-    db = Database()
-    db.connect()
-    reconcile_df = db.select_table('reconcile_events')
-    db.close_connection()
-    return reconcile_df
-
 def reconciliation_layout():
-    reconcile_df = get_data()
-
-    countries, user_ids, min_date, max_date, mismatch_type = get_reconcile_filters(reconcile_df)
+    with Database(read_only=True) as db:
+        countries, user_ids, min_date, max_date, mismatch_type = get_reconcile_filters(db)
 
     return dbc.Container([
 
@@ -108,6 +99,7 @@ def reconciliation_layout():
                                         html.P("• CALCULATION ISSUE: New balance doesn’t match expected balance after applying transaction and VAT.", className="text-muted mb-1"),
                                         html.P("• BALANCE SYNC ISSUE: Payment and subscription balances are not aligned.", className="text-muted mb-1"),
                                         html.P("• CALCULATION + BALANCE SYNC ISSUE: Both calculation mismatch and balance sync mismatch are present.", className="text-muted mb-1"),
+                                        html.P("• CHAIN BREAK: Old balance doesn’t match the new balance of the user’s previous transaction.", className="text-muted mb-1"),
                                     ],
                                     className="mt-2"
                                 )
@@ -143,9 +135,16 @@ def reconciliation_layout():
                             ], width=6, className="mb-2"),
 
                             dbc.Col([
-                                dbc.Button("Export Transactions", id="btn-export", color="info", className="mt-3 w-100"),
-                                dcc.Store(id="store-filtered-data"),
-                                dcc.Download(id="download-transactions")
+                                dbc.Button("Export Transactions", id="btn-export", color="info", className="mt-3 w-100",
+                                           external_link=True),
+                                dcc.Dropdown(
+                                    id="export-format",
+                                    options=export_format_options(),
+                                    value='csv',
+                                    clearable=False,
+                                    className="mt-2"
+                                ),
+                                dcc.Store(id="store-filtered-data")
                             ], width=6, className="mb-2"),
                         ]),
                     ])
@@ -202,10 +201,15 @@ def reconciliation_layout():
                                 # {'name': 'Source Type', 'id': 'source_type'},
                                 # {'name': 'Event Type', 'id': 'event_type'}
                             ],
+                            # Rows are paged, sorted and filtered in SQL by
+                            # update_reconciliation_table; only the current page is sent
+                            page_current=0,
                             page_size=40,
-                            data=reconcile_df.to_dict('records'),
-                            filter_action="native",
-                            sort_action="native",
+                            page_action="custom",
+                            filter_action="custom",
+                            filter_query="",
+                            sort_action="custom",
+                            sort_by=[],
                             style_table={
                                 'overflowX': 'auto',
                                 'width': '100%',
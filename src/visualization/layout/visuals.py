@@ -5,7 +5,10 @@ import plotly.graph_objects as go
 import pandas as pd
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from src.storage.db_manager import Database
+from src.visualization.data_access import get_reconcile_events_where
+
+# Columns the filter options are built from (see get_filters)
+FILTER_COLUMNS = ['country', 'user_id', 'mismatch_type', 'timestamp']
 
 def get_filters(df):
     """
@@ -25,16 +28,9 @@ def get_filters(df):
 
     return countries, mismatch_types, user_ids, min_date, max_date
 
-def get_data():
-    db = Database()
-    db.connect()
-    reconcile_df = db.select_table('reconcile_events')
-    db.close_connection()
-    return reconcile_df
-
 def trends_layout():
 
-    df = get_data()
+    df = get_reconcile_events_where(columns=FILTER_COLUMNS)
     countries, mismatch_types, user_ids, min_date, max_date = get_filters(df)
 
     return dbc.Container([
@@ -0,0 +1,118 @@
+import os
+import sys
+import gzip
+import sqlite3
+import subprocess
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.benchmark.generate_logs import generate_corpus
+from src.ingestion.load_raw_logs import compress_raw, decompress_raw
+from src.ingestion.parse_raw_to_parsed import parse_raw_table_to_parsed_logs
+from src.transformation.reconcile_events import populate_reconcile_events
+from src.reporting.generate_reports import generate_reports
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A database reconciled from a small synthetic corpus, set as DB_PATH."""
+    logs_dir = tmp_path / "logs"
+    generate_corpus(str(logs_dir), streams=12, transactions=60, users=8)
+    path = str(tmp_path / "calo.db")
+    env = dict(os.environ, LOGS_DIR=str(logs_dir), DB_PATH=path)
+    subprocess.run([sys.executable, "src/pipeline/run_pipeline.py"],
+                   cwd=REPO_ROOT, env=env, check=True, capture_output=True)
+    monkeypatch.setenv("DB_PATH", path)
+    return path
+
+
+def edit(db_path, sql, params=(), overdraft=1):
+    """
+    Run one UPDATE on the first reconcile_events row with is_overdraft =
+    overdraft and return its timestamp.
+    """
+    with sqlite3.connect(db_path) as conn:
+        rowid, timestamp = conn.execute(
+            "SELECT rowid, timestamp FROM reconcile_events WHERE is_overdraft = ? ORDER BY rowid LIMIT 1", (overdraft,)
+        ).fetchone()
+        conn.execute(f"{sql} WHERE rowid = ?", (*params, rowid))
+    return timestamp
+
+
+def reparse_with_new_transaction_id(db_path, new_id):
+    """
+    Rewrite the raw log of the first overdrawn transaction with new_id as
+    its id, re-parse and reconcile it, and return its day.
+    """
+    with sqlite3.connect(db_path) as conn:
+        filename, transaction_id, timestamp = conn.execute(
+            "SELECT filename, transaction_id, timestamp FROM reconcile_events WHERE is_overdraft = 1 ORDER BY rowid LIMIT 1"
+        ).fetchone()
+        raw, = conn.execute("SELECT raw_blob FROM raw_data WHERE filename = ?", (filename,)).fetchone()
+        edited = compress_raw(decompress_raw(raw).replace(transaction_id, new_id))
+        conn.execute("UPDATE raw_data SET raw_blob = ? WHERE filename = ?", (edited, filename))
+    parse_raw_table_to_parsed_logs()
+    populate_reconcile_events()
+    return timestamp
+
+
+def report_files(reports_dir, name):
+    return sorted(os.listdir(os.path.join(reports_dir, name)))
+
+
+def test_unchanged_reports_are_skipped(db_path, tmp_path):
+    reports_dir = str(tmp_path / "reports")
+    first = generate_reports(reports_dir=reports_dir)
+    assert all(written and not skipped for written, skipped in first.values())
+
+    second = generate_reports(reports_dir=reports_dir)
+    assert {name: written for name, (written, _) in second.items()} == {name: 0 for name in first}
+
+
+def test_edited_row_rewrites_its_report(db_path, tmp_path):
+    reports_dir = str(tmp_path / "reports")
+    generate_reports(reports_dir=reports_dir)
+
+    day = reparse_with_new_transaction_id(db_path, "EDITED")
+    results = generate_reports(reports_dir=reports_dir)
+
+    assert results["daily_overdraft"][0] == 1
+    with gzip.open(os.path.join(reports_dir, "daily_overdraft", f"overdraft_{day}.csv.gz"), "rt") as f:
+        assert "EDITED" in f.read()
+
+
+def test_relabelled_row_rewrites_weekly_report(db_path, tmp_path):
+    reports_dir = str(tmp_path / "reports")
+    generate_reports(reports_dir=reports_dir)
+
+    # Same count and balances, only the mismatch type moves
+    edit(db_path, "UPDATE reconcile_events SET mismatch_type = ?", ("CHAIN BREAK",))
+    results = generate_reports(reports_dir=reports_dir)
+
+    assert results["weekly_reconciliation"][0] == 1
+    assert results["daily_overdraft"][0] == 1
+
+
+def test_daily_overdraft_covers_overdraft_days_only(db_path, tmp_path):
+    reports_dir = str(tmp_path / "reports")
+    generate_reports(reports_dir=reports_dir)
+    with sqlite3.connect(db_path) as conn:
+        days = [day for day, in conn.execute(
+            "SELECT DISTINCT timestamp FROM reconcile_events WHERE is_overdraft = 1 ORDER BY timestamp"
+        )]
+    assert report_files(reports_dir, "daily_overdraft") == [f"overdraft_{day}.csv.gz" for day in days]
+
+    # A change to a row the overdraft report doesn't read only rewrites the weekly one
+    edit(db_path, "UPDATE reconcile_events SET mismatch_type = ?", ("CHAIN BREAK",), overdraft=0)
+    results = generate_reports(reports_dir=reports_dir)
+    assert results["daily_overdraft"][0] == 0
+    assert results["weekly_reconciliation"][0] == 1
+
+    # A day without overdrafts any more loses its file
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE reconcile_events SET is_overdraft = 0 WHERE timestamp = ?", (days[0],))
+    generate_reports(reports_dir=reports_dir)
+    assert report_files(reports_dir, "daily_overdraft") == [f"overdraft_{day}.csv.gz" for day in days[1:]]
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.ingestion.parse_raw_to_parsed import scan_record
+from src.benchmark.bench_manual_parse import load_records, long_payload, manual_parse_dep, scan_records
+
+# A payload with a nested metadata string, whose keys must not leak into the record
+METADATA_RECORD = {
+    "RequestId": "2db3c00b-d0ce-5036-a6c1-9e7d7283fcb1",
+    "StartSyncBalance": [{
+        "time": "2024-03-21",
+        "data": "{ transaction: { id: '01HSHD2ENKF5TEFD6TP3E18KJ0', type: 'DEBIT', source: 'MANUAL_DEDUCTION', "
+                "action: 'DELIVERY_DEDUCTION', userId: '2c2a8830-b2f7-4b3e-a180-7a5654eee40c', "
+                "paymentBalance: 34526.39, updatePaymentBalance: true, "
+                "metadata: '{\"walletId\":\"wallet#2c2a8830-b2f7-4b3e-a180-7a5654eee40c\","
+                "\"deliveryId\":\"01c0cdf8-f30d-4d5f-ac78-e9a06f40cad2\"}', "
+                "currency: 'SAR', amount: 90, vat: 0, oldBalance: 34706.39, newBalance: 34616.39 } }",
+    }],
+    "BalanceNotInSync": [
+        "{ userId: '2c2a8830-b2f7-4b3e-a180-7a5654eee40c', subscriptionBalance: 34616.39, paymentBalance: 34526.39 }"
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def bundled_records():
+    """extract_info records (raw payloads) of every file of the bundled Logs/ corpus."""
+    return load_records()
+
+
+def test_scanner_matches_manual_parse_dep_on_bundled_logs(bundled_records):
+    assert sum(len(records) for records in bundled_records) > 0
+    for records in bundled_records:
+        assert scan_records(records) == manual_parse_dep(records)
+
+
+def test_scanner_skips_nested_metadata():
+    record = scan_record(METADATA_RECORD)
+    assert record == manual_parse_dep([METADATA_RECORD])[0]
+    assert record["id"] == "01HSHD2ENKF5TEFD6TP3E18KJ0"
+    assert record["subscriptionBalance"] == "34616.39"
+    assert "walletId" not in record and "deliveryId" not in record
+
+
+@pytest.mark.parametrize("n_colons", [10, 250])
+def test_scanner_matches_manual_parse_dep_on_long_payloads(n_colons):
+    records = long_payload(n_colons)
+    assert scan_records(records) == manual_parse_dep(records)
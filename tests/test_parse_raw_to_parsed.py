@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.storage.db_manager import Database
+from src.benchmark.generate_logs import generate_corpus
+from src.ingestion.load_raw_logs import load_files
+import src.ingestion.parse_raw_to_parsed as parse_raw_to_parsed
+
+
+@pytest.fixture
+def logs_dir(tmp_path):
+    path = tmp_path / "logs"
+    generate_corpus(str(path), streams=12, transactions=60, users=8)
+    return str(path)
+
+
+def load_database(path, logs_dir, monkeypatch):
+    """Load logs_dir into raw_data of a new database at path, set as DB_PATH."""
+    monkeypatch.setenv("DB_PATH", str(path))
+    load_files(logs_dir=logs_dir)
+    return str(path)
+
+
+@pytest.fixture
+def db_path(tmp_path, logs_dir, monkeypatch):
+    """A database with a small synthetic corpus loaded into raw_data, set as DB_PATH."""
+    return load_database(tmp_path / "calo.db", logs_dir, monkeypatch)
+
+
+def parsed_rows(db, filename):
+    return db.connection.execute(
+        "SELECT * FROM parsed_logs WHERE filename = ? ORDER BY id", (filename,)
+    ).fetchall()
+
+
+def all_parsed_rows(path):
+    """Every parsed_logs row, without parsed_at (the time of the run)."""
+    with Database(path) as db:
+        columns = [name for name in db.get_table_schema("parsed_logs") if name != "parsed_at"]
+        return db.connection.execute(f"SELECT {', '.join(columns)} FROM parsed_logs ORDER BY id").fetchall()
+
+
+def test_parallel_parse_matches_serial(tmp_path, logs_dir, monkeypatch):
+    results = []
+    for workers in (1, 3):
+        load_database(tmp_path / f"workers-{workers}.db", logs_dir, monkeypatch)
+        parse_raw_to_parsed.parse_raw_table_to_parsed_logs(workers=workers)
+        results.append(all_parsed_rows(os.environ["DB_PATH"]))
+
+    serial, parallel = results
+    assert serial
+    assert parallel == serial
+
+
+def test_write_parsed_file_is_atomic(db_path, monkeypatch):
+    parse_raw_to_parsed.parse_raw_table_to_parsed_logs()
+
+    def fail(*args):
+        raise RuntimeError("crashed before the parse status was recorded")
+
+    with Database() as db:
+        filename, = db.connection.execute("SELECT filename FROM parsed_logs LIMIT 1").fetchone()
+        before = parsed_rows(db, filename)
+        monkeypatch.setattr(parse_raw_to_parsed, "mark_parsed", fail)
+        with pytest.raises(RuntimeError):
+            parse_raw_to_parsed.write_parsed_file(db, filename, [], "changed")
+        # The delete was rolled back with the failed status update
+        assert parsed_rows(db, filename) == before
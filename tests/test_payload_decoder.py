@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.ingestion.load_raw_logs import LOGS_DIR, read_gz_file
+from src.ingestion.payload_decoder import decode_payload, new_stats
+from src.ingestion.parse_raw_to_parsed import (
+    parse_log_string, filter_logs_by_keywords, extract_info, manual_parse
+)
+
+# Rows of the bundled logs the character scanner got wrong: (log stream,
+# RequestId, fields the decoder gets right)
+CORRECTED_ROWS = [
+    # The last transaction id had been replaced by an id from its metadata
+    ("2024-04-25-[$LATEST]7496be7a82b441cdac570936368d7383", "7f852e8e-d1ed-5d9b-8345-702a98e3164b",
+     {"id": "01HWAADC6EW7YGJNE50MPN4R4B", "newBalance": 396}),
+    ("2024-01-08-[$LATEST]b7752c0cb3844921a0253b14492477e9", "4db22482-957d-5899-99d1-7a9769af8bfa",
+     {"id": "01HKMMNW06SV5EJZSE2952FF4E", "newBalance": 201.5}),
+    # The payload after `metadata: undefined` had been skipped
+    ("2024-02-28-[$LATEST]376590f3ebca49f4b5787f7428352669", "bf3b5618-32e5-52d6-a280-084102ab53f0",
+     {"id": "01HQQWR5ZQ8TMGE0MXZF7A2H0E", "subscriptionBalance": 10295.116, "newBalance": 10295.116}),
+]
+
+
+def bundled_records(stream):
+    logs = parse_log_string(read_gz_file(os.path.join(LOGS_DIR, stream, "000000.gz")))
+    stats = new_stats()
+    return manual_parse(extract_info(filter_logs_by_keywords(logs), stats), stats), stats
+
+
+@pytest.mark.parametrize("stream, request_id, expected", CORRECTED_ROWS)
+def test_decoder_corrects_scanner_rows(stream, request_id, expected):
+    records, stats = bundled_records(stream)
+    record = next(record for record in records if record["RequestId"] == request_id)
+    assert {key: record.get(key) for key in expected} == expected
+    assert stats["malformed"] == 0 and stats["fallback_records"] == 0
+    # Nothing from the nested metadata leaks into the record
+    assert "walletId" not in record and "metadata" not in record
+
+
+def test_decode_payload_types_values():
+    payload = decode_payload(
+        "{ transaction: { id: 'a\\'b', amount: 90, vat: 0.5, updatePaymentBalance: true, metadata: undefined } }"
+    )
+    assert payload == {"transaction": {"id": "a'b", "amount": 90, "vat": 0.5,
+                                       "updatePaymentBalance": True, "metadata": None}}
+
+
+@pytest.mark.parametrize("text", ["{ id: 'truncated", "{ id: 1 } trailing", "[1, 2]"])
+def test_decode_payload_rejects_malformed(text):
+    with pytest.raises(ValueError):
+        decode_payload(text)
+
+
+def test_malformed_payload_falls_back_to_scanner():
+    logs = [
+        "2024-03-21T10:00:00.000Z 2db3c00b-d0ce-5036-a6c1-9e7d7283fcb1 INFO Start syncing the balance "
+        "{ transaction: { id: 'X1', type: 'DEBIT', userId: 'u1', amount: 90, oldBalance: 100, newBalance: 10",
+        "2024-03-21T10:00:00.000Z 2db3c00b-d0ce-5036-a6c1-9e7d7283fcb1 INFO RequestId: 2db3c00b-d0ce-5036-a6c1-9e7d7283fcb1",
+    ]
+    stats = new_stats()
+    records = manual_parse(extract_info(logs, stats), stats)
+    assert stats["malformed"] == 1 and stats["fallback_records"] == 1
+    assert records[0]["id"] == "X1"
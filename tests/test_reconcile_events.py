@@ -0,0 +1,234 @@
+import os
+import sys
+import shutil
+import sqlite3
+import contextlib
+
+import subprocess
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.storage.db_manager import Database
+from src.storage.reconcile_queries import NO_ISSUE, CHAIN_BREAK, summarize_reconcile_events, running_totals
+from src.reporting.generate_reports import weekly_summary_rows
+from src.visualization.data_access import with_derived_columns
+from src.benchmark.generate_logs import generate_corpus
+from src.ingestion.load_raw_logs import load_files, compress_raw, decompress_raw
+from src.ingestion.parse_raw_to_parsed import parse_raw_table_to_parsed_logs
+from src.transformation.reconcile_events import populate_reconcile_events
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+
+# What an incremental run must leave exactly as a full rebuild would
+STATE_QUERIES = {
+    "reconcile_events": "SELECT * FROM reconcile_events ORDER BY parsed_log_id",
+    "user_ledger": "SELECT * FROM user_ledger ORDER BY parsed_log_id",
+    "reconcile_daily_rollup": "SELECT * FROM reconcile_daily_rollup ORDER BY date, country, mismatch_type",
+}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A synthetic corpus, and an empty LOGS_DIR its streams are moved into step by step."""
+    source = tmp_path / "corpus"
+    generate_corpus(str(source), streams=16, transactions=120, users=6)
+    logs_dir = tmp_path / "logs"
+    logs_dir.mkdir()
+    return str(source), str(logs_dir)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "calo.db")
+    monkeypatch.setenv("DB_PATH", path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def bundled_db(tmp_path_factory):
+    """A database reconciled from the bundled Logs/ corpus, which has chain breaks."""
+    path = str(tmp_path_factory.mktemp("bundled") / "calo.db")
+    env = dict(os.environ, DB_PATH=path)
+    env.pop("LOGS_DIR", None)
+    subprocess.run([sys.executable, "src/pipeline/run_pipeline.py"],
+                   cwd=REPO_ROOT, env=env, check=True, capture_output=True)
+    return path
+
+
+@pytest.fixture
+def bundled_copy(bundled_db, tmp_path, monkeypatch):
+    """A copy of bundled_db tests may change, set as DB_PATH."""
+    path = str(tmp_path / "calo.db")
+    with contextlib.closing(sqlite3.connect(bundled_db)) as conn, contextlib.closing(sqlite3.connect(path)) as target:
+        conn.backup(target)
+    monkeypatch.setenv("DB_PATH", path)
+    return path
+
+
+def add_streams(source, logs_dir, streams):
+    for stream in streams:
+        shutil.copytree(os.path.join(source, stream), os.path.join(logs_dir, stream))
+
+
+def ingest(logs_dir):
+    load_files(logs_dir=logs_dir)
+    parse_raw_table_to_parsed_logs()
+    populate_reconcile_events()
+
+
+def rounded(row):
+    # Running sums differ in the last bits with summation order, as in reconcile_rollups
+    return tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+
+
+def state(path):
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        return {name: [rounded(row) for row in conn.execute(query)] for name, query in STATE_QUERIES.items()}
+
+
+def full_rebuild_state(path, tmp_path, monkeypatch):
+    """State of a copy of the database after populate_reconcile_events(full=True)."""
+    copy = str(tmp_path / "full.db")
+    with contextlib.closing(sqlite3.connect(path)) as conn, contextlib.closing(sqlite3.connect(copy)) as target:
+        conn.backup(target)
+    monkeypatch.setenv("DB_PATH", copy)
+    try:
+        populate_reconcile_events(full=True)
+    finally:
+        monkeypatch.setenv("DB_PATH", path)
+    result = state(copy)
+    os.remove(copy)
+    return result
+
+
+def assert_matches_full_rebuild(path, tmp_path, monkeypatch):
+    incremental = state(path)
+    assert incremental["reconcile_events"]
+    assert incremental == full_rebuild_state(path, tmp_path, monkeypatch)
+
+
+def test_incremental_reconcile_matches_full_rebuild(corpus, db_path, tmp_path, monkeypatch):
+    source, logs_dir = corpus
+    streams = sorted(os.listdir(source))
+
+    # New streams, in two batches
+    add_streams(source, logs_dir, streams[::2])
+    ingest(logs_dir)
+    assert_matches_full_rebuild(db_path, tmp_path, monkeypatch)
+    add_streams(source, logs_dir, streams[1::2])
+    ingest(logs_dir)
+    assert_matches_full_rebuild(db_path, tmp_path, monkeypatch)
+
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        # A whole file's rows deleted
+        with conn:
+            conn.execute("""
+                DELETE FROM parsed_logs WHERE filename = (
+                    SELECT filename FROM parsed_logs GROUP BY filename ORDER BY COUNT(*) DESC LIMIT 1
+                )
+            """)
+        populate_reconcile_events()
+        assert_matches_full_rebuild(db_path, tmp_path, monkeypatch)
+
+        # Some rows of several files deleted
+        with conn:
+            conn.execute("DELETE FROM parsed_logs WHERE id IN (SELECT id FROM parsed_logs ORDER BY id LIMIT 10 OFFSET 20)")
+        populate_reconcile_events()
+        assert_matches_full_rebuild(db_path, tmp_path, monkeypatch)
+
+        # A raw file rewritten and re-parsed with a changed transaction id
+        filename, transaction_id = conn.execute(
+            "SELECT filename, transaction_id FROM parsed_logs WHERE transaction_id IS NOT NULL ORDER BY id LIMIT 1"
+        ).fetchone()
+        raw, = conn.execute("SELECT raw_blob FROM raw_data WHERE filename = ?", (filename,)).fetchone()
+        edited = decompress_raw(raw).replace(transaction_id, "EDITED")
+        with conn:
+            conn.execute("UPDATE raw_data SET raw_blob = ? WHERE filename = ?", (compress_raw(edited), filename))
+        parse_raw_table_to_parsed_logs()
+        populate_reconcile_events()
+        assert_matches_full_rebuild(db_path, tmp_path, monkeypatch)
+        assert conn.execute("SELECT COUNT(*) FROM reconcile_events WHERE transaction_id = 'EDITED'").fetchone()[0] == 1
+        # Every recorded stale file was handled
+        assert conn.execute("SELECT COUNT(*) FROM stale_parsed_files").fetchone()[0] == 0
+
+
+def row_level_figures():
+    """Summary, mismatch running totals, weekly anomalies and dashboard anomalies of DB_PATH."""
+    with Database(read_only=True) as db:
+        summary = summarize_reconcile_events(db)
+        totals = running_totals(db, mismatches_only=True).round(6).values.tolist()
+        anomalies = sum(row[6] for row in weekly_summary_rows(db, "2000-01-03", "9999-12-31"))
+        events = db.select_table("reconcile_events")
+    return summary, totals, anomalies, int(with_derived_columns(events)["is_anomaly"].sum())
+
+
+def test_chain_breaks_leave_row_level_figures_unchanged(bundled_copy):
+    figures = row_level_figures()
+    summary = figures[0]
+    assert summary["users"] == 664
+    assert summary["total_mismatch"] == pytest.approx(-779648.07)
+    assert summary["last_sync"] == "2024-05-23"
+
+    with contextlib.closing(sqlite3.connect(bundled_copy)) as conn:
+        with conn:
+            relabelled = conn.execute(
+                "UPDATE reconcile_events SET mismatch_type = ? WHERE mismatch_type = ?", (NO_ISSUE, CHAIN_BREAK)
+            ).rowcount
+        # The rollup behind running_totals, as the unlabelled rows would give it
+        populate_reconcile_events()
+    assert relabelled == 251
+    assert row_level_figures() == figures
+
+
+def test_chain_break_flips_back_when_repaired(bundled_copy):
+    with contextlib.closing(sqlite3.connect(bundled_copy)) as conn:
+        # A break whose previous entry is the one to repair
+        row, previous = conn.execute("""
+            SELECT l.parsed_log_id, l.prev_parsed_log_id FROM user_ledger l
+            JOIN reconcile_events r ON r.parsed_log_id = l.parsed_log_id
+            WHERE r.mismatch_type = ? ORDER BY l.parsed_log_id LIMIT 1
+        """, (CHAIN_BREAK,)).fetchone()
+        old_balance, = conn.execute("SELECT oldBalance FROM parsed_logs WHERE id = ?", (row,)).fetchone()
+
+        def set_new_balance(parsed_log_id, new_balance):
+            # Re-inserted so the file is recorded stale, as a re-parse would
+            cursor = conn.execute("SELECT * FROM parsed_logs WHERE id = ?", (parsed_log_id,))
+            values = dict(zip([column[0] for column in cursor.description], cursor.fetchone()))
+            restored = values["newBalance"]
+            values["newBalance"] = new_balance
+            with conn:
+                conn.execute("DELETE FROM parsed_logs WHERE id = ?", (parsed_log_id,))
+                conn.execute(f"INSERT INTO parsed_logs ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+                             tuple(values.values()))
+            populate_reconcile_events()
+            return restored
+
+        def label():
+            return conn.execute("""
+                SELECT r.mismatch_type, l.is_chain_break FROM reconcile_events r
+                JOIN user_ledger l ON l.parsed_log_id = r.parsed_log_id WHERE r.parsed_log_id = ?
+            """, (row,)).fetchone()
+
+        restored = set_new_balance(previous, old_balance)
+        assert label() == (NO_ISSUE, 0)
+        set_new_balance(previous, restored)
+        assert label() == (CHAIN_BREAK, 1)
+
+
+def test_incremental_snapshot_matches_table(corpus, db_path):
+    pytest.importorskip("pyarrow")
+    from src.transformation.reconcile_snapshot import read_reconcile_snapshot
+
+    source, logs_dir = corpus
+    streams = sorted(os.listdir(source))
+    # The second batch only touches some partitions; the rest are linked
+    for batch in (streams[:-2], streams[-2:]):
+        add_streams(source, logs_dir, batch)
+        ingest(logs_dir)
+        with Database(read_only=True) as db:
+            snapshot = read_reconcile_snapshot(db, db.get_table_version("reconcile_events"))
+            table = db.select_table("reconcile_events")
+        assert snapshot is not None
+        assert [rounded(row) for row in snapshot[list(table.columns)].itertuples(index=False)] == \
+            [rounded(row) for row in table.itertuples(index=False)]
@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.benchmark.generate_logs import generate_corpus
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+
+
+def run_pipeline_with_metrics(tmp_path, *args):
+    """
+    Run src/pipeline/run_pipeline.py on a small synthetic corpus with
+    METRICS_PATH set, in a subprocess since metrics are switched on at
+    import. Returns the metrics records.
+    """
+    logs_dir = tmp_path / "logs"
+    generate_corpus(str(logs_dir), streams=12, transactions=60, users=8)
+    metrics_path = tmp_path / "metrics.jsonl"
+    env = dict(os.environ, LOGS_DIR=str(logs_dir), DB_PATH=str(tmp_path / "calo.db"),
+               METRICS_PATH=str(metrics_path), RECONCILE_SNAPSHOT_DIR=str(tmp_path / "snapshot"))
+    subprocess.run([sys.executable, "src/pipeline/run_pipeline.py", *args],
+                   cwd=REPO_ROOT, env=env, check=True, capture_output=True)
+    with open(metrics_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def totals(records, kind):
+    result = {}
+    for record in records:
+        if record["type"] == kind:
+            result[record["metric"]] = result.get(record["metric"], 0) + record.get("value", 1)
+    return result
+
+
+def test_run_pipeline_emits_stage_metrics(tmp_path):
+    records = run_pipeline_with_metrics(tmp_path)
+    timers = {record["metric"]: record for record in records if record["type"] == "timer"}
+    counters = totals(records, "counter")
+
+    for stage in ("load", "parse", "write", "reconcile"):
+        assert f"pipeline.{stage}" in timers
+    assert timers["pipeline.load"]["files"] == 12
+    assert "run_pipeline" in timers
+
+    assert counters["raw_data.files_inserted"] == 12
+    assert counters["parsed_logs.rows_inserted"] == timers["pipeline.write"]["rows"] > 0
+    for name in ("decoded", "malformed", "fallback_records"):
+        assert f"payload_decoder.{name}" in counters
+    assert counters["payload_decoder.decoded"] > 0
+
+
+def test_run_pipeline_direct_counts_rows(tmp_path):
+    records = run_pipeline_with_metrics(tmp_path, "--direct", "--no-reconcile")
+    counters = totals(records, "counter")
+
+    assert "raw_data.files_inserted" not in counters
+    assert counters["parsed_logs.rows_inserted"] > 0
+    assert "payload_decoder.decoded" in counters